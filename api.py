@@ -0,0 +1,331 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Local control API on a Unix socket
+#
+# One JSON object per line in both directions.
+#   request:  {"id": 1, "cmd": "dome", "args": ["left"]}
+#   response: {"id": 1, "result": null}  or  {"id": 1, "error": "..."}
+# After {"cmd": "subscribe"} the client also receives
+#   {"event": "status", "key": "...", "value": "..."}
+#   {"event": "message", "value": "..."}
+# Commands run on worker threads, and events are queued per client and
+# sent by the select() loop. A slow front end therefore never holds up the
+# control core; one that falls too far behind is disconnected.
+import os
+import json
+import socket
+import select
+import threading
+from collections import deque
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+default_socket = "/tmp/utsc-ptcs.sock"
+
+# Controller methods callable over the API, used by the server (Controller.commands)
+# and by APIClient's methods
+commands = ["get_status", "align_east", "align_west", "goto_mode", "goto", "send",
+            "dome", "toggle", "cover", "focus", "telemetry", "goto_name", "align_star", "night",
+            "schedule", "schedule_stop", "wait_settled", "frame_context"]
+
+
+def _encode(obj):
+    return (json.dumps(obj) + "\n").encode('utf-8')
+
+
+class APIConnection(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf = b""
+        self.outbox = deque()
+        self.wbuf = b""
+        self.subscribed = False
+        self.stalled = False
+
+
+class APIServer(object):
+    def __init__(self, controller, path=default_socket, max_queue=1000, workers=4):
+        self.controller = controller
+        self.path = path
+        self.max_queue = max_queue
+        self.listener = None
+        self.connections = {}   # socket -> APIConnection
+        self.jobs = queue.Queue()
+        self._wake_r, self._wake_w = os.pipe()
+        self._stop = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.workers = []   # several, so a blocking call like wait_settled doesn't hold up the others
+        for i in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            self.workers.append(worker)
+
+    def start(self):
+        if os.path.exists(self.path):
+            # Refuse to take over the socket of a running daemon, remove stale ones
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                probe.close()
+                raise RuntimeError("Control API already running on %s" % self.path)
+            except socket.error:
+                os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(5)
+        self.listener.setblocking(0)
+        self.controller.add_listener(status=self._on_status, message=self._on_message)
+        self.thread.start()
+        for worker in self.workers:
+            worker.start()
+
+    def close(self):
+        self.controller.remove_listener(status=self._on_status, message=self._on_message)
+        self._stop = True
+        self.wake()
+        for worker in self.workers:
+            self.jobs.put(None)
+        self.thread.join(1.)
+        for worker in self.workers:
+            worker.join(1.)
+        for sock in list(self.connections.keys()):
+            sock.close()
+        if self.listener is not None:
+            self.listener.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def wake(self):
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+
+    def _on_status(self, key, value):
+        self.broadcast({"event": "status", "key": key, "value": value})
+
+    def _on_message(self, value):
+        self.broadcast({"event": "message", "value": value})
+
+    def broadcast(self, obj):
+        data = None
+        for conn in list(self.connections.values()):
+            if not conn.subscribed:
+                continue
+            if data is None:
+                data = _encode(obj)     # encoded once for all subscribers
+            self._queue(conn, data)
+        if data is not None:
+            self.wake()
+
+    def _queue(self, conn, data):
+        if len(conn.outbox) >= self.max_queue:
+            conn.stalled = True
+        else:
+            conn.outbox.append(data)
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            conn, request = job
+            response = {"id": request.get("id") if isinstance(request, dict) else None}
+            try:
+                if not isinstance(request, dict):
+                    raise ValueError("Malformed request")
+                cmd = request.get("cmd")
+                args = request.get("args", [])
+                if not isinstance(args, (list, tuple)):
+                    raise ValueError("Malformed request")
+                if cmd not in self.controller.commands:
+                    raise ValueError("Unknown command %s" % cmd)
+                response["result"] = getattr(self.controller, cmd)(*args)
+            except Exception as e:
+                response["error"] = str(e)
+            self._queue(conn, _encode(response))
+            self.wake()
+
+    def run(self):
+        while self._stop==False:
+            readers = [self._wake_r, self.listener] + list(self.connections.keys())
+            writers = [c.sock for c in self.connections.values() if len(c.wbuf) or len(c.outbox)]
+            try:
+                ready, writable = select.select(readers, writers, [], None)[0:2]
+            except (select.error, OSError, ValueError):
+                continue
+            for w in writable:
+                if w in self.connections:
+                    self._write(self.connections[w])
+            for conn in list(self.connections.values()):
+                if conn.stalled:
+                    self.drop(conn)
+            for r in ready:
+                if r == self._wake_r:
+                    os.read(self._wake_r, 512)
+                elif r is self.listener:
+                    try:
+                        sock, addr = self.listener.accept()
+                    except socket.error:
+                        continue
+                    sock.setblocking(0)
+                    self.connections[sock] = APIConnection(sock)
+                elif r in self.connections:
+                    conn = self.connections[r]
+                    try:
+                        self._read(conn)
+                    except Exception as e:
+                        # A bad request must not take the server down for everyone
+                        self._queue(conn, _encode({"error": str(e)}))
+
+    def drop(self, conn):
+        self.connections.pop(conn.sock, None)
+        try:
+            conn.sock.close()
+        except:
+            pass
+
+    def _write(self, conn):
+        if len(conn.wbuf)==0:
+            while len(conn.outbox):
+                conn.wbuf += conn.outbox.popleft()
+        try:
+            n = conn.sock.send(conn.wbuf)
+        except socket.error:
+            self.drop(conn)
+            return
+        conn.wbuf = conn.wbuf[n:]
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(4096)
+        except socket.error:
+            return
+        if len(data)==0:
+            self.drop(conn)
+            return
+        conn.buf += data
+        while b"\n" in conn.buf:
+            line, conn.buf = conn.buf.split(b"\n", 1)
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                request = None
+            if not isinstance(request, dict):
+                self._queue(conn, _encode({"error": "Malformed request"}))
+                continue
+            if request.get("cmd") == "subscribe":
+                conn.subscribed = True
+                self._queue(conn, _encode({"id": request.get("id"), "result": self.controller.get_status()}))
+            else:
+                self.jobs.put((conn, request))
+
+
+class APIClient(object):
+    """Front end side of the control API.
+
+    Commands can be called as methods, e.g. client.dome("left"). If status
+    or message callbacks are given, the client subscribes to events.
+    """
+    def __init__(self, path=default_socket, status=None, message=None, timeout=10.):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.status = status
+        self.message = message
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.pending = {}   # id -> [event, response]
+        self.closed = False
+        self.thread = threading.Thread(target=self._reader)
+        self.thread.daemon = True
+        self.thread.start()
+        if status is not None or message is not None:
+            for key, value in self.call("subscribe").items():
+                if status is not None:
+                    status(key, value)
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+    def call(self, cmd, *args):
+        return self.request(cmd, args, self.timeout)
+
+    def request(self, cmd, args, timeout):
+        # Like call(), waiting up to timeout seconds for the response
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            waiter = [threading.Event(), None]
+            self.pending[request_id] = waiter
+            self.sock.sendall(_encode({"id": request_id, "cmd": cmd, "args": list(args)}))
+        if not waiter[0].wait(timeout):
+            self.pending.pop(request_id, None)
+            raise RuntimeError("No response to %s" % cmd)
+        response = waiter[1]
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response.get("result")
+
+    def wait_settled(self, timeout=120.):
+        # The daemon blocks for up to timeout seconds, so the response takes as long
+        return self.request("wait_settled", [timeout], float(timeout)+self.timeout)
+
+    def __getattr__(self, name):
+        if name in commands:
+            return lambda *args: self.call(name, *args)
+        raise AttributeError(name)
+
+    def _reader(self):
+        buf = b""
+        while not self.closed:
+            try:
+                data = self.sock.recv(4096)
+            except socket.error:
+                break
+            if len(data)==0:
+                break
+            buf += data
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                obj = json.loads(line.decode('utf-8'))
+                if "event" in obj:
+                    if obj["event"] == "status" and self.status is not None:
+                        self.status(obj["key"], obj["value"])
+                    elif obj["event"] == "message" and self.message is not None:
+                        self.message(obj["value"])
+                else:
+                    waiter = self.pending.pop(obj.get("id"), None)
+                    if waiter is not None:
+                        waiter[1] = obj
+                        waiter[0].set()
+        if not self.closed and self.message is not None:
+            self.message("ERROR: Lost connection to the control daemon.")
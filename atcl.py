@@ -0,0 +1,345 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## ATCL serial layer for the SkyWalker controller
+import threading
+import time
+from collections import deque
+
+special = [
+        [chr(0xB1), "ATCL_ENTER"],
+        [chr(0x8F), "ATCL_ACK"],
+        [chr(0xA5), "ATCL_NACK"],
+        [chr(0x9A), "ATCL_STATUS"],
+        [chr(0x9B), "ATCL_WARNING"],
+        [chr(0x9C), "ATCL_ALERT"],
+        [chr(0x9D), "ATCL_INTERNAL_ERROR"],
+        [chr(0x9E), "ATCL_SYNTAX_ERROR"],
+        [chr(0x9F), "ATCL_IDC_ASYNCH"],
+        [chr(0xA0), "ATCL_IDC_VERIFY"],
+        [chr(0xA1), "ATCL_IDC_FRAMING(1)"],
+        [chr(0xA2), "ATCL_IDC_COMM_OVERRUN(1)"],
+        [chr(0xA3), "ATCL_IDC_CMND_OVERRUN(1)"],
+        [chr(0xA4), "ATCL_CMND_TIMEOUT(1)"],
+        [chr(0xA6), "ATCL_ID_CMND"],
+        [chr(0xA7), "ATCL_ID_LINK"],
+        [chr(0xA8), "ATCL_ID_DING"],
+        [chr(0xAA), "ATCL_CHANGE_NOTIFY"],
+        ]
+special_names = dict(special)
+
+ATCL_ACK = chr(0x8F)
+ATCL_NACK = chr(0xA5)
+ATCL_ASYNCH = chr(0x9F)
+
+# Control bytes which are not worth showing in the log
+quiet_names = ["ATCL_STATUS", "ATCL_ACK", "ATCL_IDC_ASYNCH"]
+
+
+# Event types produced by the tokenizer
+TEXT = "TEXT"                   # response text, terminated by ';' or a control byte
+ASYNCH = "ASYNCH"               # text following ATCL_IDC_ASYNCH
+ACK = "ACK"
+NACK = "NACK"
+ERROR = "ERROR"                 # internal error, syntax error, command timeout
+STATUS = "STATUS"
+WARNING = "WARNING"
+ALERT = "ALERT"
+CHANGE_NOTIFY = "CHANGE_NOTIFY"
+CONTROL = "CONTROL"             # any other high-bit byte
+
+_TERMINATOR = 1
+_ASYNCH_MARK = 2
+_byte_kinds = {
+        0x8F: ACK,
+        0xA5: NACK,
+        0x9D: ERROR,
+        0x9E: ERROR,
+        0xA4: ERROR,
+        0x9A: STATUS,
+        0x9B: WARNING,
+        0x9C: ALERT,
+        0x9F: _ASYNCH_MARK,
+        0xAA: CHANGE_NOTIFY,
+        }
+
+def _build_table(terminator):
+    table = [None]*256          # None: plain text
+    for i in range(0x80, 0x100):
+        table[i] = _byte_kinds.get(i, CONTROL)
+    if terminator:
+        table[ord(';')] = _TERMINATOR
+    return table
+
+# Precomputed byte class lookup. The log variant does not split on ';'.
+frame_table = _build_table(True)
+log_table = _build_table(False)
+
+
+class ATCLTokenizer(object):
+    """Single pass tokenizer for the ATCL byte stream.
+
+    feed() may be called with arbitrary chunks. Text that is not terminated
+    yet is kept until the next call. Returns a list of (type, value) events.
+    value is the stripped text for TEXT and ASYNCH events and the control
+    byte otherwise.
+    """
+    def __init__(self, table=frame_table):
+        self.table = table
+        self.text = ""
+        self.asynch = False
+
+    def feed(self, data):
+        events = []
+        table = self.table
+        start = 0
+        for i, c in enumerate(data):
+            kind = table[ord(c)]
+            if kind is None:
+                continue
+            text = (self.text + data[start:i]).strip() if len(self.text) else data[start:i].strip()
+            self.text = ""
+            start = i+1
+            if len(text):
+                events.append((ASYNCH if self.asynch else TEXT, text))
+                self.asynch = False
+            if kind is _ASYNCH_MARK:
+                self.asynch = True
+            elif kind is not _TERMINATOR:
+                events.append((kind, c))
+        if start < len(data):
+            self.text += data[start:]
+        return events
+
+    def flush(self):
+        # Emit unterminated text, e.g. at the end of a log message
+        text = self.text.strip()
+        self.text = ""
+        asynch, self.asynch = self.asynch, False
+        if len(text):
+            return [(ASYNCH if asynch else TEXT, text)]
+        return []
+
+
+def tokenize(data, table=frame_table):
+    tokenizer = ATCLTokenizer(table)
+    return tokenizer.feed(data) + tokenizer.flush()
+
+def event_name(event):
+    # Text shown in the log for an event
+    kind, value = event
+    if kind is TEXT or kind is ASYNCH:
+        return value
+    return special_names.get(value, "ATCL_UNKNOWN(0x%02X)" % ord(value))
+
+
+def to_text(data):
+    # pyserial returns str on python 2 and bytes on python 3
+    if not isinstance(data, str):
+        data = data.decode('latin-1')
+    return data
+
+def to_bytes(data):
+    if not isinstance(data, bytes):
+        data = data.encode('latin-1')
+    return data
+
+
+class ATCLFuture(object):
+    """Response to a single ATCL command, resolved by the reader thread."""
+    def __init__(self, cmd, hideResponse=False):
+        self.cmd = cmd
+        self.hideResponse = hideResponse
+        self.sent = None
+        self.received = None
+        self._value = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set_result(self, value):
+        with self._lock:
+            self._value = value
+            self.received = time.time()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except:
+                pass
+
+    def add_done_callback(self, fn):
+        # Callbacks run on the reader thread and must not block.
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        # Returns None if the controller did not answer in time.
+        self._event.wait(timeout)
+        return self._value
+
+    def latency(self):
+        if self.sent is None or self.received is None:
+            return None
+        return self.received - self.sent
+
+
+class ATCLPort(object):
+    """One reader thread per serial port.
+
+    Incoming traffic is framed on ';' and on the high-bit control bytes from
+    the special table. Every complete response is handed to the oldest
+    command still waiting for one. Asynchronous messages and unsolicited
+    responses go to message().
+
+    Responses carry no id, so a lost one shifts every later response onto
+    the wrong command. Callers that time out call resync(), which forgets
+    all outstanding commands and drops whatever is buffered.
+    """
+    def __init__(self, port, message=None, expire=1., capture=None):
+        self.port = port
+        self.capture = open(capture, "ab") if capture is not None else None    # raw copy of everything received, see bench_atcl.py
+        self.message = message
+        self.expire = expire     # unanswered commands are dropped after this many seconds, no longer than callers wait
+        self.pending = deque()
+        self.lock = threading.Lock()        # pending and tokenizer
+        self.write_lock = threading.Lock()
+        self.tokenizer = ATCLTokenizer()
+        self._stop = False
+        self.thread = threading.Thread(target=self._reader)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def command(self, cmd, hideResponse=False):
+        future = ATCLFuture(cmd, hideResponse)
+        with self.write_lock:
+            # Register before writing so a fast reply can't overtake us
+            future.sent = time.time()
+            with self.lock:
+                self.pending.append(future)
+            self.port.write(to_bytes(cmd))
+        return future
+
+    def commands(self, cmds, hideResponse=False):
+        # Write a batch of commands in one burst. Responses come back in the
+        # same order, so the futures are returned in the order of cmds.
+        futures = [ATCLFuture(cmd, hideResponse) for cmd in cmds]
+        if len(futures)==0:
+            return futures
+        with self.write_lock:
+            now = time.time()
+            with self.lock:
+                for future in futures:
+                    future.sent = now
+                    self.pending.append(future)
+            self.port.write(to_bytes("".join(cmds)))
+        return futures
+
+    def close(self):
+        self._stop = True
+        self.thread.join(1.)
+        try:
+            self.port.close()
+        except:
+            pass
+        if self.capture is not None:
+            self.capture.close()
+        with self.lock:
+            futures, self.pending = list(self.pending), deque()
+        for future in futures:
+            future.set_result(None)
+
+    def resync(self):
+        # After a lost or malformed response: the next response belongs to
+        # the next command again. Outstanding commands resolve to None.
+        with self.lock:
+            futures, self.pending = list(self.pending), deque()
+            reset = getattr(self.port, "reset_input_buffer", None) or self.port.flushInput   # pyserial < 3
+            try:
+                reset()
+            except Exception:
+                pass
+            self.tokenizer = ATCLTokenizer()
+        for future in futures:
+            future.set_result(None)
+
+    def _show(self, value):
+        if self.message is not None and len(value)>0:
+            self.message(value)
+
+    def _reader(self):
+        while self._stop==False:
+            try:
+                data = self.port.read(1)
+                if len(data)>0:
+                    waiting = self.port.inWaiting()
+                    if waiting>0:
+                        data += self.port.read(waiting)
+            except Exception as e:
+                if self._stop==False:
+                    self._show("ERROR: Serial read failed (%s)" % e)
+                    time.sleep(1)
+                continue
+            if len(data)>0:
+                if self.capture is not None:
+                    self.capture.write(to_bytes(data))
+                self.feed(to_text(data))
+
+    def feed(self, data):
+        with self.lock:
+            events = self.tokenizer.feed(data)
+        for event in events:
+            kind, value = event
+            if kind is TEXT:
+                self._resolve(value, value)
+            elif kind is ASYNCH:
+                self._show(value)
+            elif kind is ACK or kind is NACK or kind is ERROR:
+                self._resolve(value, event_name(event))
+            else:
+                name = event_name(event)
+                if name not in quiet_names:
+                    self._show(name)
+
+    def _resolve(self, value, display):
+        now = time.time()
+        expired, future = [], None
+        with self.lock:
+            while len(self.pending) and now-self.pending[0].sent > self.expire:
+                expired.append(self.pending.popleft())
+            if len(self.pending):
+                future = self.pending.popleft()
+        for f in expired:
+            f.set_result(None)
+        if future is not None:
+            future.set_result(value)
+            if future.hideResponse:
+                return
+        if display not in quiet_names:
+            self._show(display)
+
+__all__ = ["special", "special_names", "ATCL_ACK", "ATCL_NACK", "ATCL_ASYNCH", "ATCLPort", "ATCLFuture",
+           "ATCLTokenizer", "tokenize", "event_name", "frame_table", "log_table",
+           "TEXT", "ASYNCH", "ACK", "NACK", "ERROR", "STATUS", "WARNING", "ALERT", "CHANGE_NOTIFY", "CONTROL"]
@@ -21,6 +21,14 @@ import os
 import sys
 import time
 import socket
+import solver
+
+# Where the mount thinks it points narrows the plate solve, see solver.py
+hint = None
+if "--hint" in sys.argv:
+    i = sys.argv.index("--hint")
+    hint = (float(sys.argv[i+1]), float(sys.argv[i+2]))
+    del sys.argv[i:i+3]
 
 if len(sys.argv)==1:
     sec = 10
@@ -73,25 +81,29 @@ if sec is not None:
     print("\033[92mImage captured.\033[0m")
 else:
     os.system("cp %s latest.jpg" % testimage)
+if hint is None:
+    try:
+        if sec is not None:
+            from frames import FrameIndex
+            frame = FrameIndex().latest()
+        else:
+            from camera import daemon_context
+            context = daemon_context()
+            frame = context() if context is not None else None
+        if frame is not None and frame["ra"] is not None and frame["dec"] is not None:
+            hint = (frame["ra"], frame["dec"])
+    except Exception:
+        pass
+if hint is not None:
+    print("Solving near RA %.2f Dec %+.2f..." % hint)
 os.system("rm images/astrometry/*.*")
-os.system("convert -resize 800x533 latest.jpg images/astrometry/latest_small.jpg")
-os.system("cd images/astrometry && /usr/local/astrometry/bin/solve-field latest_small.jpg --overwrite -L 30 -H 50 -u \"arcminwidth\" --parity neg --cpulimit 10 --crpix-center")
-
-ra,dec = None, None
 try:
-    with open('images/astrometry/latest_small.wcs', 'r') as f:
-        content = f.read()
-        while len(content):
-            line = content [0:80]
-            content = content[80:]
-            s = line.split("=")
-            if len(s) ==2:
-                if s[0] == "CRVAL1  ":
-                    ra = s[1].split("/")[0].strip()
-                if s[0] == "CRVAL2  ":
-                    dec = s[1].split("/")[0].strip()
-except:
-    pass
+    result = solver.solve("latest.jpg", hint)
+except Exception as e:
+    print(e)
+    result = {"ra": None, "dec": None, "hinted": False, "seconds": 0.}
+ra, dec = result["ra"], result["dec"]
+print("Plate solve took %.1f s (%s)." % (result["seconds"], "hinted" if result["hinted"] else "blind"))
 if ra != None and dec != None:
     print("\033[92mCalibration successful.\033[0m")
     ra_string, dec_string = ra_raw2str(float(ra)/360.*4294967296.), dec_raw2str(float(dec)/90.*1073741824.)
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Autofocus by V-curve search
+#
+# Coarse steps from the current position, turning round if the first
+# step makes things worse, until the focus metric rises again on the far
+# side of the best point. The bracket (and its neighbours) is then fitted
+# with a parabola, the focuser goes to the vertex and one more frame
+# measures the result. Positions are stepper steps relative to the start.
+# Every final approach is made in the positive direction, so gear
+# backlash is always taken up the same way.
+#
+# The search only needs two callables, measure() returning the metric
+# (smaller is better, None if it could not be measured) and move(steps).
+# focus.py --auto runs it on the telescope; ./autofocus.py simulates a
+# focuser to compare the number of exposures with the fixed sweep.
+import numpy as np
+
+
+class AutofocusError(Exception):
+    pass
+
+
+def fit_vertex(points):
+    # Position of the minimum of a parabola through points [(position, value)], None if not convex
+    x = np.array([p[0] for p in points], dtype=float)
+    y = np.array([p[1] for p in points], dtype=float)
+    if len(set(x)) < 3:
+        return None
+    a, b, c = np.polyfit(x, y, 2)
+    if a <= 0.:
+        return None
+    return -b/(2.*a)
+
+
+class VCurveSearch(object):
+    def __init__(self, measure, move, step, max_steps=10, backlash=0, message=None):
+        self.measure = measure      # returns the metric at the current position
+        self.move = move            # moves the focuser by the given number of steps
+        self.step = int(step)       # coarse step
+        self.max_steps = max_steps  # coarse steps in one direction before giving up
+        self.backlash = int(backlash)
+        self.message = message if message is not None else (lambda text: None)
+        self.position = 0
+        self.samples = []           # (position, value) of every measurement
+        self.exposures = 0
+
+    def goto(self, position):
+        delta = int(round(position)) - self.position
+        if delta < 0 and self.backlash:
+            # Overshoot and come back up
+            self.move(delta - self.backlash)
+            self.move(self.backlash)
+        elif delta:
+            self.move(delta)
+        self.position += delta
+
+    def sample(self, position):
+        self.goto(position)
+        value = self.measure()
+        self.exposures += 1
+        if value is not None and not np.isfinite(value):
+            value = None
+        if value is not None:
+            self.samples.append((self.position, value))
+        self.message("Focus %+d: %s" % (self.position, "no measurement" if value is None else "%.3f" % value))
+        return value
+
+    def bracketed(self):
+        # Best sample with a worse one measured on each side of it
+        if len(self.samples) < 3:
+            return None
+        best = min(self.samples, key=lambda p: p[1])
+        left = [p for p in self.samples if p[0] < best[0]]
+        right = [p for p in self.samples if p[0] > best[0]]
+        if len(left) and len(right):
+            return best
+        return None
+
+    def run(self):
+        # Returns (position, value) of the final, measured focus
+        first = self.sample(0)
+        second = self.sample(self.step)
+        direction = 1
+        if first is not None and (second is None or second > first):
+            direction = -1
+        position = self.position
+        for i in range(self.max_steps):
+            if self.bracketed() is not None:
+                break
+            if direction < 0 and self.position > 0:
+                position = 0
+            position += direction*self.step
+            self.sample(position)
+        best = self.bracketed()
+        if best is None:
+            raise AutofocusError("Minimum not found within %d steps" % (self.max_steps*self.step))
+        # Parabola through the best point and its nearest neighbours
+        near = sorted(self.samples, key=lambda p: abs(p[0]-best[0]))[:3]
+        vertex = fit_vertex(near)
+        if vertex is None or abs(vertex-best[0]) > self.step:
+            vertex = best[0]
+        value = self.sample(vertex)
+        if value is None or value > best[1]:
+            # Fit was off, the best coarse position it is
+            self.message("Fit not better than the best sample, going back to %+d" % best[0])
+            value = self.sample(best[0])
+        return self.position, value
+
+
+def sweep_exposures(n):
+    # The fixed sweep of focus.py: n steps each in directions 1, -1, -1, 1
+    return 4*n
+
+
+if __name__ == "__main__":
+    # Simulated focuser: HFR = sqrt(floor^2 + (slope*(x-focus))^2) with noise,
+    # and 4 steps of play in the gears
+    rng = np.random.RandomState(1)
+    results = []
+    for trial in range(200):
+        focus = rng.uniform(-60, 60)
+        state = {"x": 0., "motor": 0.}
+        def move(steps):
+            state["motor"] += steps
+            state["x"] = min(state["motor"], max(state["motor"]-4., state["x"]))
+        def measure():
+            return float(np.hypot(1.2, 0.08*(state["x"]-focus)) * (1.+0.02*rng.randn()))
+        search = VCurveSearch(measure, move, step=15, max_steps=12, backlash=5)
+        try:
+            position, value = search.run()
+            results.append((search.exposures, abs(state["x"]-focus), value))
+        except AutofocusError:
+            results.append((search.exposures, None, None))
+    found = [r for r in results if r[1] is not None]
+    exposures = np.array([r[0] for r in results])
+    errors = np.array([r[1] for r in found])
+    print("%d/%d runs found focus, exposures mean %.1f max %d, position error median %.1f p95 %.1f steps" % (
+        len(found), len(results), exposures.mean(), exposures.max(), np.median(errors), np.percentile(errors, 95)))
+    print("fixed sweep over the same +-60 steps with step 15: %d exposures, error up to 7.5 steps" % sweep_exposures(4))
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Microbenchmark of the ATCL tokenizer
+#
+# Usage: ./bench_atcl.py [CAPTURE ...]
+# A capture is a raw copy of the serial stream, written by ATCLPort(capture=...).
+# Without arguments a synthetic stream of status polls and asynchronous
+# bursts is used. The old recursive telescope_response() is timed as well.
+import sys
+import time
+import random
+from atcl import ATCLTokenizer, special, to_text
+
+
+def legacy_response(ret, out):
+    # The recursive parser that used to be telescope_response() in utsc-ptcs.py
+    if ret is None or len(ret)==0:
+        return
+    mask =  0b10000000
+    ret = ret.strip().strip(';')
+    for i in range(len(ret)):
+        if ord(ret[i])&mask==128:
+            if i>0:
+                out.append(ret[0:i].strip(';'))
+            for c,n in special:
+                if ret[i] == c:
+                    if n not in ["ATCL_STATUS","ATCL_ACK","ATCL_IDC_ASYNCH"]:
+                        out.append(n)
+                    break
+            if len(ret)>i:
+                legacy_response(ret[i+1:], out)
+            return
+    out.append(ret)
+
+def synthetic_stream(n, seed=1):
+    r = random.Random(seed)
+    chunks = []
+    for i in range(n):
+        x = r.random()
+        if x < 0.5:
+            chunks.append("%02d:%02d:%02d;" % (r.randint(0,23), r.randint(0,59), r.randint(0,59)))
+        elif x < 0.8:
+            chunks.append(chr(0x8F))
+        elif x < 0.95:
+            chunks.append(chr(0x9F) + "O7 Status %d;" % i)
+        else:
+            chunks.append(chr(0x9C) + "Limit reached;" + chr(0xA5))
+    return "".join(chunks)
+
+def timeit(fn, repeat=5):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        fn()
+        dt = time.time()-t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+def bench(name, data, chunk=64):
+    chunks = [data[i:i+chunk] for i in range(0, len(data), chunk)]
+    def tokenizer():
+        t = ATCLTokenizer()
+        for c in chunks:
+            t.feed(c)
+        t.flush()
+    def legacy():
+        out = []
+        for c in chunks:
+            legacy_response(c, out)
+    events = len(ATCLTokenizer().feed(data))
+    t_new = timeit(tokenizer)
+    print("%-20s %9d bytes %8d events  tokenizer %8.2f MB/s" % (name, len(data), events, len(data)/t_new/1e6))
+    try:
+        t_old = timeit(legacy)
+        print("%-20s %9s       %8s         legacy    %8.2f MB/s  (x%.1f)" % ("", "", "", len(data)/t_old/1e6, t_old/t_new))
+    except RuntimeError:
+        print("%-20s legacy parser hit the recursion limit" % "")
+
+
+if __name__ == "__main__":
+    if len(sys.argv)>1:
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                bench(path, to_text(f.read()))
+    else:
+        stream = synthetic_stream(20000)
+        bench("status polls", stream)
+        # One long asynchronous burst in a single read
+        burst = "".join(chr(0x9F) + "O7 %d;" % i + chr(0x9A) for i in range(2000))
+        bench("asynch burst", burst, chunk=len(burst))
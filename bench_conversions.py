@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Scalar vs. array coordinate conversions
+#
+# Usage: ./bench_conversions.py [N]
+# Converts N random positions both ways, checks that the array functions
+# give exactly the same results as the scalar ones and prints the speedup.
+import sys
+import time
+import random
+from conversions import *
+from conversions_array import *
+
+
+def timeit(fn, repeat=3):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        fn()
+        dt = time.time()-t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+def check(name, scalar, array):
+    array = list(array)
+    if len(scalar) != len(array):
+        raise AssertionError("%s: length differs" % name)
+    for i in range(len(scalar)):
+        if scalar[i] != array[i]:
+            raise AssertionError("%s: element %d differs, %r != %r" % (name, i, scalar[i], array[i]))
+
+def bench(name, scalar, array, values):
+    expected = [scalar(v) for v in values]
+    check(name, expected, array(values))
+    t_scalar = timeit(lambda: [scalar(v) for v in values])
+    t_array = timeit(lambda: array(values))
+    print("%-12s %8.0f ns/value scalar %8.0f ns/value array  (x%.1f)" % (name, t_scalar/len(values)*1e9, t_array/len(values)*1e9, t_scalar/t_array))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv)>1 else 200000
+    r = random.Random(1)
+    ra = [r.randint(0, 4294967295) for i in range(n)]
+    dec = [r.randint(-1073741824, 1073741824) for i in range(n)]
+    # Seconds rounding up to 60, the sign of -0 degrees and out of range values
+    ra += [ra_str2raw("01:02:59.95"), ra_str2raw("23:59:59.96"), -1, 2**40]
+    dec += [dec_str2raw("-00:30:00"), dec_str2raw("+45:00:59.95"), -5, -2**33, 2**33]
+    ra_strings = [ra_raw2str(v) for v in ra] + ["12:34:56.7"]
+    dec_strings = [dec_raw2str(v) for v in dec] + ["-00:30:00", "+89:59:59.9"]
+
+    bench("ra_raw2str", ra_raw2str, ra_raw2str_array, ra)
+    bench("dec_raw2str", dec_raw2str, dec_raw2str_array, dec)
+    bench("ra_str2raw", ra_str2raw, ra_str2raw_array, ra_strings)
+    bench("dec_str2raw", dec_str2raw, dec_str2raw_array, dec_strings)
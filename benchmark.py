@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## End-to-end latency benchmark of the control core against simulator.py
+#
+# Usage: ./benchmark.py [-n N] [--latency SEC] [-o FILE]
+# Results are written as JSON so that runs of different versions can be compared.
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import platform
+import threading
+import subprocess
+from simulator import SkyWalkerSimulator
+from telescope import Telescope
+from conversions import *
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if len(values)==0:
+        return None
+    index = int(round(p/100.*(len(values)-1)))
+    return values[index]
+
+def summary(values):
+    if len(values)==0:
+        return {"n": 0}
+    return {
+        "n":    len(values),
+        "mean": sum(values)/len(values),
+        "p50":  percentile(values, 50),
+        "p95":  percentile(values, 95),
+        "p99":  percentile(values, 99),
+        "max":  max(values),
+    }
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def connect(port, timeout=5.):
+    # The control core opens its listeners in the background
+    t0 = time.time()
+    while True:
+        try:
+            return socket.create_connection(("127.0.0.1", port))
+        except socket.error:
+            if time.time()-t0 > timeout:
+                raise
+            time.sleep(0.05)
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=subprocess.STDOUT).decode().strip()
+    except:
+        return None
+
+
+class CommandWatcher(object):
+    # Records when the simulated controller receives a given command
+    def __init__(self, sim):
+        self.expected = None
+        self.received = None
+        self.event = threading.Event()
+        sim.on_command = self.on_command
+
+    def expect(self, cmd):
+        self.expected = cmd
+        self.received = None
+        self.event.clear()
+
+    def on_command(self, cmd, t):
+        if cmd == self.expected and not self.event.is_set():
+            self.received = t
+            self.event.set()
+
+    def wait(self, timeout=5.):
+        self.event.wait(timeout)
+        return self.received
+
+
+def bench_serial(telescope, n):
+    results = []
+    for i in range(n):
+        future = telescope.port.command('!CGra;', hideResponse=True)
+        if future.result(2.) is not None:
+            results.append(future.latency())
+    return results
+
+def bench_poll(telescope, n):
+    results = []
+    due = list(range(len(telescope.states)))
+    for i in range(n):
+        t0 = time.time()
+        telescope.poll(due)
+        results.append(time.time()-t0)
+    return results
+
+def bench_stellarium(telescope, watcher, n):
+    conn = connect(telescope.stellarium_port)
+    results = []
+    for i in range(n):
+        ra = ra_str2raw("%02d:%02d:00" % (i%24, i%60))
+        dec = dec_str2raw("+%02d:00:00" % (i%80))
+        watcher.expect('!GTrd')
+        t0 = time.time()
+        conn.send(struct.pack('<hhQIi', 20, 0, int(round(t0*1000)), ra, dec))
+        t1 = watcher.wait()
+        if t1 is not None:
+            results.append(t1-t0)
+        time.sleep(0.05)
+    conn.close()
+    return results
+
+def bench_autoalignment(telescope, watcher, n):
+    conn = connect(telescope.autoalignment_port)
+    results = []
+    for i in range(n):
+        watcher.expect('!AFrn')
+        t0 = time.time()
+        conn.send(("East;%02d:%02d:00;+%02d:00:00" % (i%24, i%60, i%80)).encode())
+        t1 = watcher.wait()
+        if t1 is not None:
+            results.append(t1-t0)
+        time.sleep(0.05)
+    conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency benchmark of the telescope control core.")
+    parser.add_argument("-n", type=int, default=100, help="samples per benchmark")
+    parser.add_argument("--latency", type=float, default=0.01, help="latency of the simulated controller in seconds")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON output file")
+    args = parser.parse_args()
+
+    sim = SkyWalkerSimulator(latency=args.latency, slew=100.).start()
+    watcher = CommandWatcher(sim)
+    messages = []
+    telescope = Telescope(message=messages.append, stellarium_port=free_port(), autoalignment_port=free_port())
+    if not telescope.open(sim.port_name):
+        print("Cannot open simulated controller on %s" % sim.port_name)
+        sys.exit(1)
+
+    results = {}
+    def run(name, fn, *fnargs):
+        print("Running %s..." % name)
+        results[name] = summary(fn(*fnargs))
+        r = results[name]
+        if r["n"]:
+            print("  n=%d  p50=%.2fms  p95=%.2fms  p99=%.2fms" % (r["n"], r["p50"]*1e3, r["p95"]*1e3, r["p99"]*1e3))
+
+    # Serial and poll are measured before the polling thread runs, it would
+    # send its own batches on the same port in between.
+    run("serial_round_trip",   bench_serial,        telescope, args.n)
+    run("status_poll_cycle",   bench_poll,          telescope, args.n)
+    telescope.start()
+    run("stellarium_goto",     bench_stellarium,    telescope, watcher, args.n)
+    run("autoalignment_sync",  bench_autoalignment, telescope, watcher, args.n)
+
+    telescope.close()
+    sim.stop()
+
+    report = {
+        "revision":   git_revision(),
+        "time":       time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python":     platform.python_version(),
+        "machine":    platform.machine(),
+        "samples":    args.n,
+        "controller_latency": args.latency,
+        "results":    results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4, sort_keys=True)
+    print("Results written to %s" % args.output)
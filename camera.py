@@ -0,0 +1,407 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Camera backends and capture sessions
+#
+# GPhotoCamera keeps one libgphoto2 session open (python-gphoto2) instead
+# of running the gphoto2 command several times per frame. Settings are
+# only sent when they change. Once the download of a frame is known to fit
+# into the exposure, a frame's files are left on the camera and fetched
+# while the shutter is open for the next one; all camera calls stay on
+# the capture thread. FakeCamera serves files from disk with a
+# configurable exposure, download and USB probe time, for measuring
+# throughput without hardware.
+#
+# CaptureSession takes N bulb exposures back to back. A writer thread
+# saves the files while the next exposure is already running and hands
+# the JPEG to thumbnails.Renditions for the medium and small versions.
+# With a frames.FrameIndex, frame numbers come from the index and every
+# frame is added to it together with the telescope context (pointing,
+# focus, alignment side) at the start of the exposure.
+#
+# Usage: ./camera.py --fake FILE_OR_DIR [-s SEC] [-n NUM] [--probe SEC]
+# compares the session against the old one-gphoto2-call-per-step path.
+import os
+import time
+import glob
+import shutil
+import threading
+from thumbnails import Renditions, link, render, sizes
+from fractions import Fraction
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class CameraError(Exception):
+    pass
+
+
+class Download(object):
+    # A file still on the camera. Calling it blocks until the capture thread
+    # has fetched it and returns the data.
+    def __init__(self, folder, name):
+        self.folder = folder
+        self.name = name
+        self.data = None
+        self.error = None
+        self.event = threading.Event()
+
+    def set(self, data=None, error=None):
+        self.data = data
+        self.error = error
+        self.event.set()
+
+    def __call__(self):
+        self.event.wait()
+        if self.error is not None:
+            raise CameraError("Download of %s failed: %s" % (self.name, self.error))
+        return self.data
+
+
+class DeferredDownloads(object):
+    # Shared by the cameras: files are fetched right away until a download is
+    # known to fit into the exposure, then during the next exposure.
+    margin = 1.     # seconds the download has to leave of the exposure
+
+    def _init_downloads(self):
+        self.deferred = []          # Downloads to fetch during the next exposure
+        self.download_time = None   # seconds the last frame's files took
+
+    def _files(self, added, seconds):
+        # [(name, Download)] for the (folder, name) of the files of a frame
+        downloads = [Download(folder, name) for folder, name in added]
+        if self.download_time is not None and self.download_time+self.margin < seconds:
+            self.deferred += downloads
+        else:
+            self._fetch(downloads)
+        return [(d.name, d) for d in downloads]
+
+    def _fetch(self, downloads):
+        t0 = time.time()
+        for d in downloads:
+            try:
+                d.set(self._get(d.folder, d.name))
+            except Exception as e:
+                d.set(error=e)
+        self.download_time = time.time()-t0
+
+    def collect(self):
+        # Fetches the files still on the camera, called while the shutter is
+        # open and at the end of a run
+        deferred, self.deferred = self.deferred, []
+        if len(deferred):
+            self._fetch(deferred)
+
+
+class GPhotoCamera(DeferredDownloads):
+    def __init__(self):
+        try:
+            import gphoto2 as gp
+        except ImportError:
+            raise CameraError("python-gphoto2 is required for the camera (pip install gphoto2)")
+        self.gp = gp
+        os.system("killall gvfsd-gphoto2 > /dev/null 2>&1")
+        self.camera = gp.Camera()
+        try:
+            self.camera.init()
+        except gp.GPhoto2Error as e:
+            raise CameraError("Cannot open camera: %s" % e)
+        self.settings = {}
+        self._init_downloads()
+
+    def set(self, name, value):
+        # Only talks to the camera if the value changed
+        if self.settings.get(name) == value:
+            return
+        try:
+            widget = self.camera.get_single_config(name)
+            if isinstance(value, int) and widget.get_type() in [self.gp.GP_WIDGET_RADIO, self.gp.GP_WIDGET_MENU]:
+                widget.set_value(widget.get_choice(value))
+            else:
+                widget.set_value(value)
+            self.camera.set_single_config(name, widget)
+        except self.gp.GPhoto2Error as e:
+            raise CameraError("Cannot set %s=%s: %s" % (name, value, e))
+        self.settings[name] = value
+
+    def configure(self, iso):
+        self.set("imageformat", 8)      # RAW + large JPEG
+        self.set("capture", 1)
+        self.set("iso", str(iso))
+        self.set("shutterspeed", "bulb")
+
+    def expose(self, seconds):
+        # Bulb exposure, returns [(name, Download)] for the files the camera wrote
+        gp = self.gp
+        try:
+            self.camera.set_single_config("eosremoterelease", self._release("Immediate"))
+            opened = time.time()
+            self.collect()      # the previous frame, while the shutter is open
+            time.sleep(max(0., seconds-(time.time()-opened)))
+            self.camera.set_single_config("eosremoterelease", self._release("Release Full"))
+            added = []
+            deadline = time.time()+5.+seconds*0.1
+            while time.time() < deadline:
+                event, data = self.camera.wait_for_event(500)
+                if event == gp.GP_EVENT_FILE_ADDED:
+                    added.append((data.folder, data.name))
+                elif event == gp.GP_EVENT_CAPTURE_COMPLETE or (event == gp.GP_EVENT_TIMEOUT and len(added)>=2):
+                    break
+        except gp.GPhoto2Error as e:
+            raise CameraError("Exposure failed: %s" % e)
+        if len(added)==0:
+            raise CameraError("No image received from camera")
+        return self._files(added, seconds)
+
+    def _get(self, folder, name):
+        f = self.camera.file_get(folder, name, self.gp.GP_FILE_TYPE_NORMAL)
+        return memoryview(f.get_data_and_size()).tobytes()
+
+    def _release(self, value):
+        widget = self.camera.get_single_config("eosremoterelease")
+        widget.set_value(value)
+        return widget
+
+    def close(self):
+        self.collect()
+        self.camera.exit()
+
+
+class FakeCamera(DeferredDownloads):
+    # Serves the given JPEG (and matching .cr2, if any) files in turn
+    def __init__(self, source, probe=0., download_rate=20e6, time_scale=1.):
+        if os.path.isdir(source):
+            self.files = sorted(glob.glob(os.path.join(source, "*.jpg")))
+        elif os.path.isfile(source):
+            self.files = [source]
+        else:
+            self.files = []
+        if len(self.files)==0:
+            raise CameraError("No images in %s" % source)
+        self.probe = probe                  # USB probe time per session [s]
+        self.download_rate = download_rate  # bytes per second
+        self.time_scale = time_scale        # < 1 to shorten exposures in tests
+        self.settings = {}
+        self.index = 0
+        self.sets = 0
+        self._init_downloads()
+        time.sleep(self.probe)
+
+    def set(self, name, value):
+        if self.settings.get(name) == value:
+            return
+        self.sets += 1
+        self.settings[name] = value
+
+    def configure(self, iso):
+        self.set("imageformat", 8)
+        self.set("capture", 1)
+        self.set("iso", str(iso))
+        self.set("shutterspeed", "bulb")
+
+    def expose(self, seconds):
+        opened = time.time()
+        self.collect()
+        time.sleep(max(0., seconds*self.time_scale-(time.time()-opened)))
+        jpg = self.files[self.index % len(self.files)]
+        self.index += 1
+        added = [(path, name) for path, name in [(jpg, "capt0000.jpg"), (jpg[:-4]+".cr2", "capt0001.cr2")] if os.path.exists(path)]
+        return self._files(added, seconds*self.time_scale)
+
+    def _get(self, path, name):
+        with open(path, "rb") as f:
+            data = f.read()
+        time.sleep(len(data)/self.download_rate)
+        return data
+
+    def close(self):
+        self.collect()
+
+
+def frame_name(kind, i, jd, iso, shutter, ext):
+    # Same names as the old takeimages.py
+    return "%s_%05d_jd%015.6f_iso%s_shutter%ss.%s" % (kind, i, jd, iso, shutter.replace("/","_"), ext)
+
+
+class CaptureSession(object):
+    def __init__(self, camera, directory="images", resize=True, workers=2, backlog=4, index=None, context=None):
+        self.camera = camera
+        self.directory = directory
+        self.index = index          # frames.FrameIndex
+        self.context = context      # returns a dict of extra index columns, e.g. Controller.frame_context
+        # Created before the writer thread, the pool forks its workers
+        self.renditions = Renditions(directory, workers, backlog) if resize else None
+        self.jobs = queue.Queue(maxsize=4)  # frames waiting to be written
+        self.errors = []
+        self.writer = threading.Thread(target=self._write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def close(self):
+        self.jobs.put(None)
+        self.writer.join()
+        if self.renditions is not None:
+            self.renditions.close()
+        self.camera.close()
+
+    def run(self, seconds, count, iso="3200", progress=None, stop=None):
+        # Takes count exposures, returns the number captured.
+        # seconds can also be a string like "30" or "1/10"
+        shutter = seconds if isinstance(seconds, str) else "%g" % seconds
+        seconds = float(Fraction(shutter))
+        d = time.strftime("%Y-%m-%d")
+        if self.index is not None:
+            start = self.index.next_number(d)
+        else:
+            start = len(glob.glob(os.path.join(self.directory, d, "full*.jpg")))
+        self.camera.configure(iso)
+        done = 0
+        try:
+            for i in range(start, start+count):
+                if stop is not None and stop.is_set():
+                    break
+                context = self._context()
+                jd = (time.time() / 86400.0) + 2440587.5
+                files = self.camera.expose(seconds)
+                self.jobs.put((d, i, jd, iso, shutter, files, seconds, context))
+                done += 1
+                if progress is not None:
+                    progress(done, count)
+        finally:
+            self.camera.collect()   # files of the last frame, the writer waits for them
+        self.flush()
+        return done
+
+    def flush(self):
+        # Waits until all frames are on disk
+        self.jobs.join()
+        if self.renditions is not None:
+            self.renditions.flush()
+            self.errors += self.renditions.errors
+            self.renditions.errors = []
+        if len(self.errors):
+            errors, self.errors = self.errors, []
+            raise CameraError("; ".join(errors))
+
+    def capture(self, target, stop):
+        # For ScheduleRunner(capture=session.capture)
+        try:
+            return self.run(target.exposure, target.count, target.iso, stop=stop) == target.count
+        except CameraError:
+            return False
+
+    def _context(self):
+        if self.context is None:
+            return {}
+        try:
+            return self.context()
+        except Exception:
+            return {}
+
+    def _write(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+            try:
+                self._save(*job)
+            except Exception as e:
+                self.errors.append(str(e))
+            self.jobs.task_done()
+
+    def _save(self, d, i, jd, iso, shutter, files, seconds=None, context={}):
+        directory = os.path.join(self.directory, d)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        saved = {}
+        for name, data in files:
+            if callable(data):
+                data = data()   # Download, fetched by the capture thread
+            ext = name.rsplit(".", 1)[-1].lower()
+            path = os.path.join(directory, frame_name("full", i, jd, iso, shutter, ext))
+            with open(path, "wb") as f:
+                f.write(data)
+            shutil.copyfile(path, "latest.%s" % ext)
+            saved[ext] = path
+        if "jpg" not in saved:
+            return
+        full = saved["jpg"]
+        paths = {}
+        if self.renditions is not None:
+            paths = dict((kind, os.path.join(directory, frame_name(kind, i, jd, iso, shutter, "jpg"))) for kind in ["medium", "small"])
+            self.renditions.submit(i, full, paths)
+        else:
+            link(os.path.relpath(full, self.directory), os.path.join(self.directory, "latest_full.jpg"))
+        if self.index is not None:
+            self.index.add(date=d, number=i, jd=jd, exposure=seconds, shutter=shutter, iso=iso,
+                           full=full, raw=saved.get("cr2"), medium=paths.get("medium"), small=paths.get("small"), **context)
+
+
+def daemon_context():
+    # Controller.frame_context of a running ptcsd.py or utsc-ptcs.py, None if there is none
+    try:
+        from api import APIClient, default_socket
+        client = APIClient(default_socket, timeout=2.)
+    except Exception:
+        return None
+    return client.frame_context
+
+
+def open_camera(fake=None, **kwargs):
+    if fake is not None:
+        return FakeCamera(fake, **kwargs)
+    return GPhotoCamera()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Camera throughput with a fake camera")
+    parser.add_argument("--fake", required=True, help="JPEG file or directory served by the fake camera")
+    parser.add_argument("-s", "--seconds", type=float, default=1.)
+    parser.add_argument("-n", "--count", type=int, default=10)
+    parser.add_argument("--probe", type=float, default=1.5, help="USB probe time of one gphoto2 run [s]")
+    parser.add_argument("-o", "--output", default="/tmp/camera-bench")
+    args = parser.parse_args()
+
+    # Old path: a new gphoto2 process (and USB probe) for each of the three
+    # steps per frame, resizing before the next exposure
+    t0 = time.time()
+    d = time.strftime("%Y-%m-%d")
+    for i in range(args.count):
+        FakeCamera(args.fake, probe=args.probe).set("iso", "3200")
+        FakeCamera(args.fake, probe=args.probe).set("shutterspeed", "bulb")
+        files = FakeCamera(args.fake, probe=args.probe).expose(args.seconds)
+        session = CaptureSession(None, args.output, resize=False)
+        session._save(d, i, 0., "3200", "%g" % args.seconds, files)
+        session.jobs.put(None)
+        full = os.path.join(args.output, d, frame_name("full", i, 0., "3200", "%g" % args.seconds, "jpg"))
+        render(full, [(os.path.join(args.output, d, frame_name(kind, i, 0., "3200", "%g" % args.seconds, "jpg")), size) for kind, size in sizes])
+    legacy = time.time()-t0
+
+    t0 = time.time()
+    session = CaptureSession(FakeCamera(args.fake, probe=args.probe), args.output)
+    session.run(args.seconds, args.count)
+    session.close()
+    persistent = time.time()-t0
+
+    for name, dt in [("per-call gphoto2", legacy), ("persistent session", persistent)]:
+        print("%-20s %6.1f s for %d x %gs  %7.0f frames per hour  (%.0f%% shutter open)" % (name, dt, args.count, args.seconds, args.count/dt*3600., 100.*args.count*args.seconds/dt))
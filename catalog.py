@@ -0,0 +1,185 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Local object catalog
+#
+# catalog.csv is compiled once into a numpy record array (catalog.csv.npy,
+# memory-mapped on later starts), sorted by sky cell. Cells are dec bands
+# of `band` degrees cut into roughly square RA cells, so a cone search
+# only looks at the cells around the cone and then checks the exact
+# distance with unit vectors. Coordinates are J2000 degrees; use precess()
+# to get the equinox of date which the telescope expects.
+import os
+import math
+import time
+from collections import namedtuple
+import numpy as np
+from conversions import ra_raw2str, dec_raw2str
+from conversions_array import ra_deg2raw, dec_deg2raw
+
+Entry = namedtuple("Entry", ["name", "kind", "ra", "dec", "mag"])
+
+band = 2.   # degrees
+
+dtype = np.dtype([
+    ("name",    "S32"),
+    ("kind",    "S4"),
+    ("ra",      "<f8"),
+    ("dec",     "<f8"),
+    ("mag",     "<f4"),
+    ("xyz",     "<f8", (3,)),
+    ("cell",    "<i4"),
+    ("aliases", "S96"),
+])
+
+nbands = int(round(180./band))
+band_cells = np.array([max(1, int(round(360.*math.cos(math.radians(-90.+(b+.5)*band))/band))) for b in range(nbands)])
+band_offset = np.concatenate(([0], np.cumsum(band_cells)))
+
+
+def unit_vectors(ra, dec):
+    ra, dec = np.radians(ra), np.radians(dec)
+    return np.stack((np.cos(dec)*np.cos(ra), np.cos(dec)*np.sin(ra), np.sin(dec)), axis=-1)
+
+def cell_of(ra, dec):
+    b = np.clip(((np.asarray(dec)+90.)/band).astype(np.int64), 0, nbands-1)
+    n = band_cells[b]
+    c = (np.mod(ra, 360.)/360.*n).astype(np.int64) % n
+    return band_offset[b] + c
+
+def normalize(name):
+    return " ".join(name.lower().split())
+
+def precess(ra, dec, t=None):
+    # J2000 -> equinox of date (IAU 1976), degrees in and out
+    t = time.time() if t is None else t
+    T = (t/86400.+2440587.5-2451545.0)/36525.
+    zeta = math.radians((2306.2181*T + 0.30188*T*T + 0.017998*T**3)/3600.)
+    z = math.radians((2306.2181*T + 1.09468*T*T + 0.018203*T**3)/3600.)
+    theta = math.radians((2004.3109*T - 0.42665*T*T - 0.041833*T**3)/3600.)
+    ra, dec = np.radians(ra)+zeta, np.radians(dec)
+    a = np.cos(dec)*np.sin(ra)
+    b = math.cos(theta)*np.cos(dec)*np.cos(ra) - math.sin(theta)*np.sin(dec)
+    c = math.sin(theta)*np.cos(dec)*np.cos(ra) + math.cos(theta)*np.sin(dec)
+    return np.mod(np.degrees(np.arctan2(a, b)+z), 360.), np.degrees(np.arcsin(np.clip(c, -1., 1.)))
+
+def compile_csv(path):
+    rows = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if len(line)==0 or line[0]=="#" or line.startswith("name,"):
+                continue
+            fields = line.split(",")
+            rows.append((fields[0], fields[1], float(fields[2]), float(fields[3]), float(fields[4]),
+                         fields[5] if len(fields)>5 else ""))
+    data = np.zeros(len(rows), dtype=dtype)
+    for i, (name, kind, ra, dec, mag, aliases) in enumerate(rows):
+        data[i] = (name.encode("utf-8"), kind.encode("utf-8"), ra, dec, mag, (0.,0.,0.), 0, aliases.encode("utf-8"))
+    data["xyz"] = unit_vectors(data["ra"], data["dec"])
+    data["cell"] = cell_of(data["ra"], data["dec"])
+    return data[np.argsort(data["cell"], kind="stable")]
+
+
+class Catalog(object):
+    def __init__(self, path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.csv")):
+        cache = path + ".npy"
+        if not os.path.exists(cache) or os.path.getmtime(cache) < os.path.getmtime(path):
+            data = compile_csv(path)
+            try:
+                np.save(cache, data)
+            except (IOError, OSError):
+                self.data = data
+        if not hasattr(self, "data"):
+            self.data = np.load(cache, mmap_mode="r")
+        self.cell_start = np.searchsorted(self.data["cell"], np.arange(band_offset[-1]+1))
+        self.names = {}
+        for i in range(len(self.data)):
+            for name in [self.data["name"][i]] + self.data["aliases"][i].split(b"|"):
+                if len(name):
+                    self.names[normalize(name.decode("utf-8"))] = i
+
+    def __len__(self):
+        return len(self.data)
+
+    def entry(self, i):
+        r = self.data[i]
+        return Entry(r["name"].decode("utf-8"), r["kind"].decode("utf-8"), float(r["ra"]), float(r["dec"]), float(r["mag"]))
+
+    def lookup(self, name):
+        # Index of an object by name or alias, None if unknown
+        return self.names.get(normalize(name))
+
+    def _candidates(self, ra, dec, radius):
+        dec0, dec1 = max(-90., dec-radius), min(90., dec+radius)
+        bands = range(int((dec0+90.)/band), min(nbands-1, int((dec1+90.)/band))+1)
+        if radius >= 90.-abs(dec):
+            half = 180.     # cone contains a pole
+        else:
+            # widest extent in RA of a cone which doesn't contain a pole
+            half = math.degrees(math.asin(min(1., math.sin(math.radians(radius))/math.cos(math.radians(dec)))))
+        chunks = []
+        for b in bands:
+            n = band_cells[b]
+            c0 = int(math.floor((ra-half)/360.*n))
+            c1 = int(math.floor((ra+half)/360.*n))
+            if c1-c0 >= n-1:
+                cells = range(n)
+            else:
+                cells = [x % n for x in range(c0, c1+1)]
+            for c in cells:
+                cell = band_offset[b]+c
+                if self.cell_start[cell+1] > self.cell_start[cell]:
+                    chunks.append(np.arange(self.cell_start[cell], self.cell_start[cell+1]))
+        if len(chunks)==0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(chunks)
+
+    def cone(self, ra, dec, radius, mag_limit=None, kind=None):
+        # Indices within radius degrees of (ra, dec), nearest first
+        idx = self._candidates(ra, dec, radius)
+        v = unit_vectors(ra, dec)
+        cosd = np.dot(self.data["xyz"][idx], v)
+        keep = cosd >= math.cos(math.radians(min(radius, 180.)))
+        if mag_limit is not None:
+            keep &= self.data["mag"][idx] <= mag_limit
+        if kind is not None:
+            keep &= self.data["kind"][idx] == kind.encode("utf-8")
+        idx, cosd = idx[keep], cosd[keep]
+        return idx[np.argsort(-cosd, kind="stable")]
+
+    def nearest(self, ra, dec, mag_limit=None, kind=None, exclude=()):
+        # Closest matching object, searching in growing cones
+        for radius in [5., 20., 60., 180.]:
+            for i in self.cone(ra, dec, radius, mag_limit, kind):
+                if i not in exclude:
+                    return int(i)
+        return None
+
+    def separation(self, i, ra, dec):
+        return math.degrees(math.acos(min(1., max(-1., float(np.dot(self.data["xyz"][i], unit_vectors(ra, dec)))))))
+
+    def coordinates_deg(self, i, t=None):
+        # Equinox of date in degrees
+        ra, dec = precess(self.data["ra"][i], self.data["dec"][i], t)
+        return float(ra), float(dec)
+
+    def coordinates(self, i, t=None):
+        # Equinox of date as strings for Telescope.goto() and align()
+        ra, dec = self.coordinates_deg(i, t)
+        return ra_raw2str(int(ra_deg2raw(ra))), dec_raw2str(int(dec_deg2raw(dec)))
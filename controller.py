@@ -0,0 +1,219 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Control core: telescope and observatory behind one set of commands
+#
+# Front ends (the curses UI, ptcsd.py clients, scripts) only talk to a
+# Controller, either directly or through api.py. Status lines and log
+# messages are pushed to every registered listener.
+import threading
+import api
+from telescope import Telescope
+from observatory import Observatory
+from telemetry import TelemetryStore
+from catalog import Catalog
+from ephemeris import Ephemeris
+from scheduler import Scheduler, ScheduleRunner, targets_from_dicts
+from conversions_array import ra_raw2deg, dec_raw2deg
+from atcl import tokenize, event_name, log_table, quiet_names
+
+
+class Controller(object):
+    # Methods which may be called through the control API
+    commands = api.commands
+
+    def __init__(self, journal=None, telemetry=None, **kwargs):
+        self.journal = journal
+        if telemetry is None:
+            telemetry = TelemetryStore()
+        self.telemetry_store = telemetry
+        self.catalog = Catalog()
+        self.ephemeris = Ephemeris()
+        self.schedule_runner = ScheduleRunner(self, Scheduler(self.ephemeris))
+        self.statuses = {}
+        self.status_listeners = []
+        self.message_listeners = []
+        self.lock = threading.Lock()
+        self.observatory = Observatory(message=self.message, status=self.status, telemetry=telemetry, ephemeris=self.ephemeris)
+        self.telescope = Telescope(message=self.message, status=self.status, focus=self.observatory.stepperMove, telemetry=telemetry, **kwargs)
+
+    def start(self, port_name):
+        self.status("Alignment mode", "GoTo next coordinates.")
+        self.observatory.start()
+        self.telescope.open(port_name)
+        self.telescope.start()
+
+    def close(self):
+        self.schedule_runner.stop()
+        self.telescope.close()
+        self.observatory.close()
+        self.telemetry_store.close()
+
+    def status(self, key, value):
+        with self.lock:
+            self.statuses[key] = value
+            listeners = list(self.status_listeners)
+        for listener in listeners:
+            listener(key, value)
+
+    def message(self, value):
+        for event in tokenize(value.replace('\n',' '), log_table):
+            value = event_name(event)
+            if self.journal is not None:
+                self.journal.write(value)
+            if len(value)>2:
+                if value[0:2]=="O7":
+                    continue
+            if value in quiet_names:
+                continue
+            with self.lock:
+                listeners = list(self.message_listeners)
+            for listener in listeners:
+                listener(value)
+
+    def add_listener(self, status=None, message=None):
+        with self.lock:
+            if status is not None:
+                self.status_listeners.append(status)
+            if message is not None:
+                self.message_listeners.append(message)
+
+    def remove_listener(self, status=None, message=None):
+        with self.lock:
+            if status in self.status_listeners:
+                self.status_listeners.remove(status)
+            if message in self.message_listeners:
+                self.message_listeners.remove(message)
+
+    # Commands
+    def get_status(self):
+        with self.lock:
+            return dict(self.statuses)
+
+    def align_east(self):
+        self.telescope.start_manual_alignment_e()
+        self.suggest_alignment_star()
+
+    def align_west(self):
+        self.telescope.start_manual_alignment_w()
+        self.suggest_alignment_star()
+
+    def pointing(self):
+        # Current position in degrees, None before the first poll
+        position = self.telescope.motion.estimate()
+        if position is None:
+            return None
+        return float(ra_raw2deg(position[0])), float(dec_raw2deg(position[1]))
+
+    def frame_context(self):
+        # Stored with every captured frame, see frames.py
+        pointing = self.pointing()
+        return {"ra": None if pointing is None else pointing[0],
+                "dec": None if pointing is None else pointing[1],
+                "focus": self.observatory.focussteppercount,
+                "side": self.telescope.states[1][0] or None}
+
+    def alignment_star(self):
+        # Nearest bright star to where the telescope points
+        pointing = self.pointing()
+        if pointing is None:
+            return None
+        return self.catalog.nearest(pointing[0], pointing[1], mag_limit=2.5, kind="star")
+
+    def suggest_alignment_star(self):
+        i = self.alignment_star()
+        if i is not None:
+            pointing = self.pointing()
+            self.message("Nearest alignment star: %s (%.1f deg away)" % (self.catalog.entry(i).name, self.catalog.separation(i, pointing[0], pointing[1])))
+
+    def goto_mode(self):
+        self.telescope.alignment_mode = "goto"
+        self.status("Alignment mode", "GoTo next coordinates.")
+
+    def goto(self, ra_string, dec_string):
+        self.telescope.goto(ra_string, dec_string)
+
+    def wait_settled(self, timeout=120.):
+        # Blocks until the mount has settled after the last goto
+        return self.telescope.settle.wait(float(timeout))
+
+    def settled(self):
+        # Future resolved with the settle time, for callers which must not block
+        return self.telescope.settle.future()
+
+    def goto_name(self, name):
+        # Goto (or sync, in alignment mode) to a catalog object
+        i = self.catalog.lookup(name)
+        if i is None:
+            raise ValueError("Unknown object %s" % name)
+        ra_string, dec_string = self.catalog.coordinates(i)
+        self.message("%s: %s %s" % (self.catalog.entry(i).name, ra_string, dec_string))
+        self.telescope.goto(ra_string, dec_string)
+        return self.catalog.entry(i).name
+
+    def night(self):
+        # Twilight times and moon of the current night, see ephemeris.py
+        return self.ephemeris.night()
+
+    def schedule(self, items):
+        # Plan and run a list of targets, see scheduler.py. Returns the plan.
+        plan = self.schedule_runner.start(targets_from_dicts(items, self.catalog))
+        return [(target.to_dict(), slew_start, start) for target, slew_start, start in plan]
+
+    def schedule_stop(self):
+        self.schedule_runner.stop()
+
+    def align_star(self, direction, name=None):
+        # Sync on a star centered in the eyepiece, by default the nearest bright one
+        i = self.alignment_star() if name is None else self.catalog.lookup(name)
+        if i is None:
+            raise ValueError("No alignment star found")
+        ra_string, dec_string = self.catalog.coordinates(i)
+        self.message("Aligning on %s (%s): %s %s" % (self.catalog.entry(i).name, direction, ra_string, dec_string))
+        self.telescope.align(direction, ra_string, dec_string)
+        return self.catalog.entry(i).name
+
+    def send(self, cmd):
+        # Raw ATCL command, e.g. "!AGas;". Returns the response as shown in the log.
+        self.message("Send: "+cmd)
+        self.telescope.lock.acquire()
+        ret = self.telescope.telescope_cmd(cmd)
+        self.telescope.lock.release()
+        if ret is None:
+            ret = "None"
+        else:
+            ret = " ".join(event_name(event) for event in tokenize(ret))
+        self.message("Recv: "+ret)
+        return ret
+
+    def dome(self, direction):
+        self.observatory.dome(direction)
+
+    def toggle(self, n):
+        self.observatory.toggle(int(n))
+
+    def cover(self):
+        self.observatory.cover()
+
+    def focus(self, direction):
+        self.observatory.focus(int(direction))
+
+    def telemetry(self, last=600.):
+        # Columns of the last `last` seconds as lists, see telemetry.py
+        data = self.telemetry_store.query(last=float(last))
+        return dict((name, column.tolist()) for name, column in data.items())
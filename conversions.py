@@ -1,5 +1,7 @@
 
 ## Conversion functions
+import re
+
 def dec_str2raw(s):
     f = [float(i) for i in s.split(":")]
     if f[0]<0.:
@@ -21,4 +23,15 @@ def ra_raw2str(raw):
     ra = float(raw)/2147483648.0 *12.0
     return  "%02d:%02d:%02d" % (int(ra),  int(ra%1*60),  round(ra%1*60%1*60, 1)) 
 
-__all__ = ["dec_str2raw","ra_str2raw","dec_raw2str","ra_raw2str"]
+# Shape of the controller's coordinate replies, HH:MM:SS and DD:MM:SS with an
+# optional sign, the same forms dec_str2raw accepts
+_ra_pattern = re.compile(r"^\d{1,2}:\d{2}:\d{2}(\.\d*)?$")
+_dec_pattern = re.compile(r"^[+-]?\d{1,2}:\d{2}:\d{2}(\.\d*)?$")
+
+def is_ra_str(s):
+    return _ra_pattern.match(s) is not None
+
+def is_dec_str(s):
+    return _dec_pattern.match(s) is not None
+
+__all__ = ["dec_str2raw","ra_str2raw","dec_raw2str","ra_raw2str","is_ra_str","is_dec_str"]
@@ -0,0 +1,102 @@
+## Array versions of the conversion functions
+# Same arithmetic as the scalar functions in conversions.py, element by
+# element, so the results are identical. Strings go in as any sequence and
+# come out as numpy arrays of str.
+import numpy as np
+
+def _fields(strings):
+    strings = [s for s in strings]
+    f = np.array(" ".join(strings).replace(":", " ").split(), dtype=float)
+    if len(f) != 3*len(strings):
+        raise ValueError("Coordinates need three fields separated by ':'")
+    f = f.reshape(-1, 3)
+    return f[:,0], f[:,1], f[:,2]
+
+def _round1(x):
+    # Python's round(x, 1) for x >= 0. It rounds the exact binary value,
+    # np.round does not, so values close to a tie are left to Python.
+    r = np.round(x, 1)
+    x10 = x*10.
+    tie = np.abs(x10-np.floor(x10)-0.5) < 1e-6
+    for i in np.nonzero(tie)[0]:
+        r[i] = round(float(x[i]), 1)
+    return r
+
+def dec_str2raw_array(strings):
+    d, m, s = _fields(strings)
+    dec = np.where(d<0., d-m/60.-s/60./60., d+m/60.+s/60./60.)
+    return np.trunc(dec*1073741824.0/90.0).astype(np.int64)
+
+def ra_str2raw_array(strings):
+    h, m, s = _fields(strings)
+    ra = h+m/60.+s/60./60.
+    return np.trunc(ra*2147483648.0/12.0).astype(np.int64)
+
+def _join(d, m, s, signed):
+    # Builds "%02d:%02d:%02d" (or "%+02d:...") byte by byte. Rows which don't
+    # fit two digits are formatted with % instead.
+    fmt = "%+02d:%02d:%02d" if signed else "%02d:%02d:%02d"
+    n = len(d)
+    bad = (np.abs(d) > 99) if signed else ((d < 0) | (d > 99))
+    ad = np.where(bad, 0, np.abs(d))
+    out = np.zeros((n, 9), dtype=np.uint8)     # trailing zeros are dropped by the S9 view
+    rows = np.arange(n)
+    if signed:
+        out[:,0] = np.where(d<0, ord("-"), ord("+"))
+        wide = (ad>=10).astype(np.int64)       # %+02d only pads to two characters including the sign
+        out[:,1] = np.where(wide, 48+ad//10, 48+ad%10)
+        out[rows,1+wide] = 48+ad%10
+        c = 2+wide
+    else:
+        out[:,0] = 48+ad//10
+        out[:,1] = 48+ad%10
+        c = np.full(n, 2, dtype=np.int64)
+    out[rows,c] = ord(":")
+    out[rows,c+1] = 48+m//10
+    out[rows,c+2] = 48+m%10
+    out[rows,c+3] = ord(":")
+    out[rows,c+4] = 48+s//10
+    out[rows,c+5] = 48+s%10
+    result = out.view("S9").ravel().astype("U32" if bad.any() else "U9")
+    for i in np.nonzero(bad)[0]:
+        result[i] = fmt % (d[i], m[i], s[i])
+    return result
+
+def dec_raw2str_array(raw):
+    dec = np.asarray(raw, dtype=float)/1073741824.0*90.0
+    a = np.abs(dec)%1*60
+    return _join(np.trunc(dec).astype(np.int64), np.trunc(a).astype(np.int64), np.trunc(_round1(a%1*60)).astype(np.int64), True)
+
+def ra_raw2str_array(raw):
+    ra = np.asarray(raw, dtype=float)/2147483648.0 *12.0
+    a = ra%1*60
+    return _join(np.trunc(ra).astype(np.int64), np.trunc(a).astype(np.int64), np.trunc(_round1(a%1*60)).astype(np.int64), False)
+
+# Degrees and radians. RA raw wraps around at 2**32 (24h), Dec raw is signed.
+def ra_deg2raw(deg):
+    return (np.trunc(np.asarray(deg, dtype=float)/360.*4294967296.).astype(np.int64)) % 4294967296
+
+def ra_raw2deg(raw):
+    return np.asarray(raw, dtype=float)/4294967296.*360.
+
+def dec_deg2raw(deg):
+    return np.trunc(np.asarray(deg, dtype=float)/90.*1073741824.).astype(np.int64)
+
+def dec_raw2deg(raw):
+    return np.asarray(raw, dtype=float)/1073741824.*90.
+
+def ra_rad2raw(rad):
+    return ra_deg2raw(np.degrees(rad))
+
+def ra_raw2rad(raw):
+    return np.radians(ra_raw2deg(raw))
+
+def dec_rad2raw(rad):
+    return dec_deg2raw(np.degrees(rad))
+
+def dec_raw2rad(raw):
+    return np.radians(dec_raw2deg(raw))
+
+__all__ = ["dec_str2raw_array","ra_str2raw_array","dec_raw2str_array","ra_raw2str_array",
+           "ra_deg2raw","ra_raw2deg","dec_deg2raw","dec_raw2deg",
+           "ra_rad2raw","ra_raw2rad","dec_rad2raw","dec_raw2rad"]
@@ -9,6 +9,8 @@ current_info = [';']
 
 def open_port():
     port_name = ''
+    if len(sys.argv)>1:
+         port_name = sys.argv[1]
     if os.uname()[0]=="Darwin":
          default_port_name = '/dev/tty.usbserial'
     else:
@@ -0,0 +1,158 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Cached sidereal time and ephemerides
+#
+# Local sidereal time is a straight line in time. It is anchored with
+# pyephem every `refresh` seconds and extrapolated in between. Things that
+# only change from night to night (sun and twilight times, rise/transit/set
+# of a target) are computed once and kept in small LRU caches. All times
+# are unix times.
+import math
+import time
+import threading
+from collections import OrderedDict
+import ephem
+
+sidereal_rate = 2.*math.pi*1.00273790935/86400.     # rad per SI second
+unix_epoch = 25567.5                                # ephem date of 1970-01-01 0h UT
+
+
+def to_ephem(t):
+    return ephem.Date(t/86400.+unix_epoch)
+
+def to_unix(d):
+    return (float(d)-unix_epoch)*86400.
+
+def night_start(t):
+    # Local noon at the start of the night t belongs to, see telemetry.night_of()
+    lt = time.localtime(t-12*3600)
+    return time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday, 12, 0, 0, 0, 0, -1))
+
+
+class LRU(object):
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        try:
+            value = self.items.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = compute()
+            self.misses += 1
+            if len(self.items) >= self.maxsize:
+                self.items.popitem(last=False)
+        self.items[key] = value
+        return value
+
+
+class Ephemeris(object):
+    def __init__(self, city="Toronto", lat=None, lon=None, elevation=None, refresh=600.):
+        self.observer = ephem.city(city)
+        if lat is not None:
+            self.observer.lat = str(lat)
+        if lon is not None:
+            self.observer.lon = str(lon)
+        if elevation is not None:
+            self.observer.elevation = elevation
+        self.refresh = refresh
+        self.lock = threading.Lock()    # ephem.Observer is not thread safe
+        self.anchor = None              # (unix time, lst in radians)
+        self.nights = LRU(8)
+        self.targets = LRU(256)
+
+    def _observer(self, t):
+        o = ephem.Observer()
+        o.lat, o.lon, o.elevation = self.observer.lat, self.observer.lon, self.observer.elevation
+        o.date = to_ephem(t)
+        return o
+
+    def lst(self, t=None):
+        # Local sidereal time in radians
+        t = time.time() if t is None else t
+        anchor = self.anchor
+        if anchor is None or abs(t-anchor[0]) > self.refresh:
+            with self.lock:
+                self.observer.date = to_ephem(t)
+                anchor = (t, float(self.observer.sidereal_time()))
+            self.anchor = anchor
+        return (anchor[1] + (t-anchor[0])*sidereal_rate) % (2.*math.pi)
+
+    def lst_string(self, t=None):
+        # Same format as str(observer.sidereal_time())
+        return str(ephem.hours(self.lst(t)))
+
+    def hour_angle(self, ra, t=None):
+        # ra in degrees, result in hours between -12 and 12
+        ha = math.degrees(self.lst(t))/15. - ra/15.
+        return (ha+12.) % 24. - 12.
+
+    def altitude(self, ra, dec, t=None):
+        # Altitude in degrees of an equinox of date position, no refraction
+        ha = math.radians(self.hour_angle(ra, t)*15.)
+        lat, dec = float(self.observer.lat), math.radians(dec)
+        return math.degrees(math.asin(math.sin(lat)*math.sin(dec) + math.cos(lat)*math.cos(dec)*math.cos(ha)))
+
+    def night(self, t=None):
+        # Sun and moon events of the night containing t
+        start = night_start(time.time() if t is None else t)
+        return self.nights.get(start, lambda: self._night(start))
+
+    def _night(self, start):
+        result = {"start": start}
+        with self.lock:
+            for name, horizon in [("sun", "-0:34"), ("civil", "-6"), ("nautical", "-12"), ("astronomical", "-18")]:
+                o = self._observer(start)
+                o.horizon = horizon
+                sun = ephem.Sun()
+                try:
+                    dusk = o.next_setting(sun, use_center=(name!="sun"))
+                    o.date = dusk
+                    dawn = o.next_rising(sun, use_center=(name!="sun"))
+                    result[name] = (to_unix(dusk), to_unix(dawn))
+                except (ephem.AlwaysUpError, ephem.NeverUpError):
+                    result[name] = None
+            o = self._observer(start+12*3600)   # local midnight
+            moon = ephem.Moon(o)
+            result["moon"] = {"ra": math.degrees(moon.ra), "dec": math.degrees(moon.dec), "phase": moon.phase}
+        return result
+
+    def target(self, ra, dec, t=None):
+        # Rise, transit and set (unix times, None if circumpolar or never up)
+        # of an equinox of date position during the night containing t
+        start = night_start(time.time() if t is None else t)
+        key = (round(ra, 4), round(dec, 4), start)
+        return self.targets.get(key, lambda: self._target(ra, dec, start))
+
+    def _target(self, ra, dec, start):
+        body = ephem.FixedBody()
+        body._ra, body._dec = math.radians(ra), math.radians(dec)
+        body._epoch = to_ephem(start)
+        result = {}
+        with self.lock:
+            for name, method in [("rise", "next_rising"), ("transit", "next_transit"), ("set", "next_setting")]:
+                o = self._observer(start)
+                try:
+                    result[name] = to_unix(getattr(o, method)(body))
+                except (ephem.AlwaysUpError, ephem.NeverUpError):
+                    result[name] = None
+        return result
@@ -21,8 +21,13 @@ import os
 import sys
 import time
 import socket
+import focusmetric
+from autofocus import VCurveSearch, AutofocusError
 timestamp = int(time.time())
 
+auto = "--auto" in sys.argv
+if auto:
+    sys.argv.remove("--auto")
 if len(sys.argv)==4 or len(sys.argv)==5:
     sec = float(sys.argv[1])
     inc = int(sys.argv[2])
@@ -40,6 +45,9 @@ else:
     print("                               ^-- trial in each direction")
     print("                                   total = 4 * FOCUSN")
     print("                                      ^-- optional")
+    print("       ./focus.py SEC FOCUSINC FOCUSN ISO --auto")
+    print("                      ^-- coarse step of the V-curve search")
+    print("                               ^-- at most this many steps in one direction")
     quit(0)
 
 focushtml = """
@@ -48,6 +56,7 @@ focushtml = """
     <script>
         var cur = 0;
         var images = ["IMAGES"];
+        var scores = ["SCORES"];
         function next(inc) {
             cur = cur + inc;
             if (cur >= images.length){
@@ -57,7 +66,7 @@ focushtml = """
                 cur = images.length-1;
             }
             document.getElementById("focusimg").src=images[cur]+"?"+CACHE;
-            document.getElementById("focustext").innerHTML=(cur+1) + "/" + images.length + " : " + images[cur];
+            document.getElementById("focustext").innerHTML=(cur+1) + "/" + images.length + " : " + images[cur] + " : " + scores[cur];
         }
         document.onkeydown = function(event) {
              if (!event)
@@ -101,23 +110,75 @@ os.system("rm images/focus/*.*")
 focus = 0
 piccount = 0
 images = []
+scores = []
+results = []
+
+def capture():
+    # Takes one image at the current focus, returns its focusmetric result (None if it failed)
+    global piccount
+    print("Taking image %d%s."%(piccount+1, "" if auto else "/%d"%(n*4)))
+    r = os.system("./takeimages.py %f 1 %d"%(sec,iso))<<8
+    if r!=0:
+        print("\033[91mProblem encountered trying to take image. Make sure camera is connected and not in use.\033[0m")
+        quit(0)
+    time.sleep(0.25)
+    filename = "images/focus/pic%04d_focus%+04d.jpg"%(piccount,focus)
+    images.append(filename.split("/")[-1])
+    os.system("convert images/latest_full.jpg -gravity Center -crop 15\%%\! "+filename)
+    result = None
+    try:
+        result = focusmetric.measure_file(filename)
+        results.append((focus, result))
+        scores.append(focusmetric.summary(result))
+        print("Focus %+d: %s" % (focus, scores[-1]))
+    except Exception as e:
+        print("No focus metric: %s" % e)
+        scores.append("no metric")
+    piccount += 1
+    with open("images/focus/focus.html","w") as f:
+        f.write((focushtml.replace("IMAGES","\", \"".join(images))).replace("SCORES","\", \"".join(scores)).replace("CACHE","%d"%timestamp))
+    return result
+
+def move(steps):
+    # The control system takes at most 20 steps per command
+    global focus
+    while steps:
+        chunk = max(-20, min(20, steps))
+        send_socket.send(("Focus;%d"%chunk).encode())
+        focus += chunk
+        steps -= chunk
+        time.sleep(0.5+0.04*abs(chunk))
+
+if auto:
+    metric = []     # "hfr" or "contrast", chosen on the first image
+    def measure():
+        result = capture()
+        if result is None:
+            return None
+        if len(metric)==0:
+            metric.append("hfr" if result["stars"]>=3 else "contrast")
+            print("Using %s as focus metric." % metric[0].upper())
+        if metric[0]=="hfr":
+            return result["hfr"] if result["stars"]>=3 else None
+        return -result["contrast"]
+    search = VCurveSearch(measure, move, inc, max_steps=n, backlash=inc//2)
+    try:
+        position, value = search.run()
+    except AutofocusError as e:
+        print("\033[91m%s. Focus left at %+d.\033[0m" % (e, focus))
+        quit(0)
+    print("\033[92mFocus at %+d (relative to the start) after %d images: %s %.3f.\033[0m" % (position, search.exposures, metric[0].upper(), abs(value)))
+    quit(0)
+
 for direction in [1, -1, -1, 1]:
     for i in range(n):
-        print("Taking image %d/%d."%(piccount+1,n*4))
-        r = os.system("./takeimages.py %f 1 %d"%(sec,iso))<<8
-        if r!=0:
-            print("\033[91mProblem encountered trying to take image. Make sure camera is connected and not in use.\033[0m")
-            quit(0)
-        time.sleep(0.25)
-        filename = "images/focus/pic%04d_focus%+04d.jpg"%(piccount,focus)
-        images.append(filename.split("/")[-1])
-        os.system("convert images/latest_full.jpg -gravity Center -crop 15\%%\! "+filename)
-        send_socket.send("Focus"+";"+"%d"%(direction*inc))
-        focus += direction*inc
-        piccount += 1
-        
-        with open("images/focus/focus.html","w") as f:
-            f.write((focushtml.replace("IMAGES","\", \"".join(images))).replace("CACHE","%d"%timestamp))
-
-        time.sleep(0.5)
+        capture()
+        move(direction*inc)
 
+measured = [(r["hfr"], focus) for focus, r in results if r["hfr"] is not None]
+if len(measured):
+    hfr, best = min(measured)
+    print("\033[92mSmallest HFR %.2f px at focus %+d (relative to the start).\033[0m" % (hfr, best))
+elif len(results):
+    best = max((r["contrast"], focus) for focus, r in results)[1]
+    print("\033[92mNo stars found. Highest contrast at focus %+d (relative to the start).\033[0m" % best)
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Focus quality of an image
+#
+# Stars are found as local maxima of a 3x3 smoothed image above the
+# background, then cut out as (stars, size, size) stamps with one fancy
+# index, so all measurements are whole-array operations:
+#   hfr       flux weighted mean distance from the centroid (pixels)
+#   fwhm      of a Gaussian with the star's flux and peak (pixels)
+#   contrast  mean squared gradient over the noise variance, counting only
+#             pixels more than 3 sigma above the background
+# Smaller hfr/fwhm and a larger contrast mean better focus. The contrast
+# also works when there are too few stars, e.g. on the moon.
+#
+# Usage: ./focusmetric.py IMAGE [IMAGE ...]   writes IMAGE.json next to each
+import os
+import sys
+import json
+import time
+import numpy as np
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def load(path, crop=None):
+    # Grey scale float32 image, optionally only the central fraction crop of each axis
+    if Image is None:
+        raise ImportError("Pillow is required to read images")
+    image = Image.open(path)
+    if crop is not None:
+        w, h = image.size
+        cw, ch = int(w*crop), int(h*crop)
+        image = image.crop(((w-cw)//2, (h-ch)//2, (w-cw)//2+cw, (h-ch)//2+ch))
+    return np.asarray(image.convert("L"), dtype=np.float32)
+
+
+def background(image, step=4):
+    # Median and noise of a sparse pixel sample. The noise is the standard deviation
+    # after clipping at 5 MAD; the MAD alone jumps between steps on 8 bit images.
+    sample = image[::step, ::step].ravel()
+    median = np.median(sample)
+    mad = 1.4826*np.median(np.abs(sample-median))
+    noise = sample[np.abs(sample-median) < 5.*max(mad, 1.)].std()
+    return float(median), float(max(noise, 0.5))
+
+
+def smooth(image):
+    # 3x3 box mean, same shape (edges left as they are), as two 1d passes
+    rows = image[:-2] + image[1:-1] + image[2:]
+    s = image.copy()
+    s[1:-1, 1:-1] = (rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:])/9.
+    return s
+
+
+def detect(image, bkg, noise, threshold=5., radius=8, max_stars=100, saturation=250.):
+    # Star centres (y, x) brightest first, at least radius apart and away from the edges
+    s = smooth(image)
+    y, x = np.nonzero(s[radius:-radius, radius:-radius] > bkg + threshold*noise/3.)
+    y, x = y+radius, x+radius
+    # Local maxima, only checked where above the threshold
+    value = s[y, x]
+    peak = image[y, x] < saturation
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dy or dx:
+                peak &= value >= s[y+dy, x+dx]
+    y, x = y[peak], x[peak]
+    order = np.argsort(-s[y, x], kind="stable")[:4*max_stars]
+    y, x = y[order], x[order]
+    # Drop peaks close to a brighter one (blends, double detections)
+    d2 = (y[:, None]-y[None, :])**2 + (x[:, None]-x[None, :])**2
+    brighter_close = np.tril(d2 < (2*radius)**2, -1).any(axis=1)
+    return y[~brighter_close][:max_stars], x[~brighter_close][:max_stars]
+
+
+def stamps(image, y, x, radius):
+    # (len(y), 2*radius+1, 2*radius+1) cut-outs around the given centres
+    d = np.arange(-radius, radius+1)
+    return image[y[:, None, None]+d[None, :, None], x[:, None, None]+d[None, None, :]]
+
+
+def contrast(image, bkg, noise):
+    image = image - np.float32(bkg)
+    image[image < 3.*noise] = 0.
+    gy = np.diff(image, axis=0)
+    gx = np.diff(image, axis=1)
+    return float((np.mean(gy*gy) + np.mean(gx*gx))/(noise*noise))
+
+
+def measure(image, radius=8, threshold=5., max_stars=100):
+    # All metrics of one grey scale image as a dict, see the top of the file
+    t0 = time.time()
+    bkg, noise = background(image)
+    y, x = detect(image, bkg, noise, threshold, radius, max_stars)
+    f = stamps(image, y, x, radius) - bkg
+    f[f < 3.*noise] = 0.        # only pixels clearly above the background
+    flux = f.sum(axis=(1, 2))
+    keep = flux > 0.            # detected on the smoothed image, but no single pixel above 3 sigma
+    y, x, f, flux = y[keep], x[keep], f[keep], flux[keep]
+    result = {"stars": int(len(y)), "background": bkg, "noise": noise,
+              "contrast": contrast(image, bkg, noise), "hfr": None, "fwhm": None}
+    if len(y):
+        d = np.arange(-radius, radius+1, dtype=np.float32)
+        cy = (f.sum(axis=2)*d).sum(axis=1)/flux
+        cx = (f.sum(axis=1)*d).sum(axis=1)/flux
+        r = np.sqrt((d[None, :, None]-cy[:, None, None])**2 + (d[None, None, :]-cx[:, None, None])**2)
+        hfr = (f*r).sum(axis=(1, 2))/flux
+        fwhm = 2.3548*np.sqrt(flux/(2.*np.pi*f.max(axis=(1, 2))))
+        result.update({"hfr": float(np.median(hfr)), "fwhm": float(np.median(fwhm)),
+                       "star_y": y.tolist(), "star_x": x.tolist(),
+                       "star_hfr": np.round(hfr, 3).tolist(), "star_fwhm": np.round(fwhm, 3).tolist()})
+    result["seconds"] = time.time()-t0
+    return result
+
+
+def measure_file(path, crop=None, save=True, **kwargs):
+    # Measures an image file and, with save, stores the result as path.json
+    result = measure(load(path, crop), **kwargs)
+    result["image"] = os.path.basename(path)
+    if save:
+        with open(path+".json", "w") as f:
+            json.dump(result, f)
+    return result
+
+
+def summary(result):
+    if result["hfr"] is None:
+        return "no stars, contrast %.3f" % result["contrast"]
+    return "%d stars, HFR %.2f px, FWHM %.2f px, contrast %.3f" % (result["stars"], result["hfr"], result["fwhm"], result["contrast"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv)<2:
+        print("Usage: ./focusmetric.py IMAGE [IMAGE ...]")
+        exit(-1)
+    for path in sys.argv[1:]:
+        result = measure_file(path)
+        print("%s: %s (%.0f ms)" % (path, summary(result), result["seconds"]*1000.))
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Index of captured frames
+#
+# One SQLite row per frame, written by camera.CaptureSession when the
+# files are on disk: date directory, frame number, JD, exposure, ISO,
+# where the telescope pointed, focus stepper count, alignment side and
+# the paths of all versions. Frame numbers, the latest frame and the
+# frames of a night come from the index instead of globbing images/.
+# Dates captured before the index existed are imported once from the
+# file names. WAL mode lets readers query while a capture is running.
+#
+# Usage: ./frames.py [DATE]     list the frames of a date (default: today)
+#        ./frames.py --latest   show the latest frame
+import os
+import re
+import sys
+import glob
+import time
+import sqlite3
+import threading
+
+default_path = os.path.join("images", "frames.sqlite")
+
+columns = ["date", "number", "jd", "exposure", "shutter", "iso", "ra", "dec", "focus", "side",
+           "full", "raw", "medium", "small"]
+
+schema = """
+CREATE TABLE IF NOT EXISTS frames (
+    id       INTEGER PRIMARY KEY,
+    date     TEXT NOT NULL,
+    number   INTEGER NOT NULL,
+    jd       REAL NOT NULL,
+    exposure REAL,
+    shutter  TEXT,
+    iso      TEXT,
+    ra       REAL,
+    dec      REAL,
+    focus    INTEGER,
+    side     TEXT,
+    full     TEXT,
+    raw      TEXT,
+    medium   TEXT,
+    small    TEXT,
+    UNIQUE (date, number)
+);
+CREATE INDEX IF NOT EXISTS frames_jd ON frames (jd);
+CREATE TABLE IF NOT EXISTS imported (date TEXT PRIMARY KEY);
+"""
+
+name_pattern = re.compile(r"^full_(\d+)_jd([0-9.]+)_iso([^_]+)_shutter(.+)s\.jpg$")
+
+
+class FrameIndex(object):
+    def __init__(self, path=default_path, directory=None):
+        self.directory = os.path.dirname(path) if directory is None else directory
+        if len(self.directory) and not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # Used by the capture loop and the writer thread, hence the lock
+        self.db = sqlite3.connect(path, timeout=10., check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(schema)
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _import(self, date):
+        # Frames of a date directory written before the index, from the file names
+        if self.db.execute("SELECT 1 FROM imported WHERE date=?", (date,)).fetchone() is None:
+            rows = []
+            for path in glob.glob(os.path.join(self.directory, date, "full_*.jpg")):
+                m = name_pattern.match(os.path.basename(path))
+                if m is None:
+                    continue
+                number, jd, iso, shutter = int(m.group(1)), float(m.group(2)), m.group(3), m.group(4).replace("_", "/")
+                version = lambda kind, ext: os.path.join(os.path.dirname(path), kind+os.path.basename(path)[4:-4]+ext)
+                rows.append((date, number, jd, None, shutter, iso, path, version("full", ".cr2"),
+                             version("medium", ".jpg"), version("small", ".jpg")))
+            self.db.executemany("INSERT OR IGNORE INTO frames (date, number, jd, exposure, shutter, iso, full, raw, medium, small) "
+                                "VALUES (?,?,?,?,?,?,?,?,?,?)", rows)
+            self.db.execute("INSERT INTO imported (date) VALUES (?)", (date,))
+            self.db.commit()
+
+    def next_number(self, date):
+        with self.lock:
+            self._import(date)
+            n = self.db.execute("SELECT MAX(number) FROM frames WHERE date=?", (date,)).fetchone()[0]
+        return 0 if n is None else n+1
+
+    def add(self, **frame):
+        # Keys from `columns`, date, number and jd are required
+        keys = [c for c in columns if c in frame]
+        with self.lock:
+            self._import(frame["date"])
+            self.db.execute("INSERT OR REPLACE INTO frames (%s) VALUES (%s)" % (", ".join(keys), ", ".join("?"*len(keys))),
+                            [frame[k] for k in keys])
+            self.db.commit()
+
+    def latest(self):
+        # Newest frame as a dict, None if there is none
+        with self.lock:
+            row = self.db.execute("SELECT * FROM frames ORDER BY jd DESC LIMIT 1").fetchone()
+        return None if row is None else dict(row)
+
+    def night(self, date):
+        # All frames of a date directory in capture order
+        with self.lock:
+            self._import(date)
+            return [dict(row) for row in self.db.execute("SELECT * FROM frames WHERE date=? ORDER BY number", (date,))]
+
+    def between(self, jd0, jd1):
+        with self.lock:
+            return [dict(row) for row in self.db.execute("SELECT * FROM frames WHERE jd>=? AND jd<? ORDER BY jd", (jd0, jd1))]
+
+
+if __name__ == "__main__":
+    index = FrameIndex()
+    if "--latest" in sys.argv:
+        frames = [index.latest()] if index.latest() is not None else []
+    else:
+        frames = index.night(sys.argv[1] if len(sys.argv)>1 else time.strftime("%Y-%m-%d"))
+    for f in frames:
+        pointing = "%8.3f %+7.3f" % (f["ra"], f["dec"]) if f["ra"] is not None else " "*16
+        print("%5d  %.6f  %6ss  ISO %-5s %s  %6s  %-5s %s" % (f["number"], f["jd"], f["shutter"], f["iso"], pointing,
+                                                         "" if f["focus"] is None else f["focus"], f["side"] or "", f["full"]))
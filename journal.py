@@ -0,0 +1,96 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Size-rotated JSONL journal of all log messages
+#
+# Each line is {"t": unix time, "msg": text}. Callers only append to an
+# in-memory queue; a background thread writes to disk once a second and
+# rotates journal.jsonl -> journal.jsonl.1 -> ... when it gets too big.
+import os
+import json
+import time
+import threading
+from collections import deque
+
+
+class Journal(object):
+    def __init__(self, path="logs/journal.jsonl", max_bytes=10*1024*1024, backups=10, interval=1., max_pending=100000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.interval = interval
+        self.pending = deque(maxlen=max_pending)    # oldest entries are lost if the disk can't keep up
+        self.event = threading.Event()
+        self._stop = False
+        directory = os.path.dirname(path)
+        if len(directory) and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self.event.set()
+        self.thread.join(5.)
+
+    def write(self, text, t=None):
+        self.pending.append((time.time() if t is None else t, text))
+
+    def run(self):
+        while True:
+            self.event.wait(self.interval)
+            self.flush()
+            if self._stop:
+                return
+
+    def flush(self):
+        lines = []
+        while len(self.pending):
+            t, text = self.pending.popleft()
+            if not isinstance(text, type(u"")):
+                text = text.decode('latin-1')
+            lines.append(json.dumps({"t": round(t, 3), "msg": text}) + "\n")
+        if len(lines)==0:
+            return
+        with open(self.path, "a") as f:
+            f.write("".join(lines))
+            size = f.tell()
+        if size > self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        for i in range(self.backups-1, 0, -1):
+            src = "%s.%d" % (self.path, i)
+            if os.path.exists(src):
+                os.rename(src, "%s.%d" % (self.path, i+1))
+        os.rename(self.path, self.path + ".1")
+
+
+def read(path):
+    # Yields (time, message) from a journal file
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            yield entry["t"], entry["msg"]
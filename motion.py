@@ -0,0 +1,90 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Motion model which extrapolates the mount position between serial polls
+#
+# Positions are in the raw units of the Stellarium protocol (see
+# conversions.py): RA wraps around at 2**32, Dec is signed.
+import time
+import threading
+from collections import deque
+
+RA_WRAP = 4294967296
+
+
+def ra_diff(a, b):
+    # Shortest signed distance from b to a in raw RA units
+    return (a - b + RA_WRAP//2) % RA_WRAP - RA_WRAP//2
+
+
+class MotionModel(object):
+    def __init__(self, horizon=1.5, samples=3):
+        self.horizon = horizon  # never extrapolate further than this many seconds past the last sample
+        self.samples = deque(maxlen=samples)
+        self.target = None
+        self.lock = threading.Lock()
+
+    def add_sample(self, ra, dec, t=None):
+        if t is None:
+            t = time.time()
+        with self.lock:
+            self.samples.append((t, ra, dec))
+
+    def set_target(self, ra, dec):
+        # Target of a goto. Extrapolation stops there instead of overshooting,
+        # until clear_target() is called once the mount has settled.
+        with self.lock:
+            self.target = (ra, dec)
+
+    def clear_target(self):
+        # Also forgets the samples from the slew, so the speed starts from zero
+        with self.lock:
+            self.target = None
+            if len(self.samples):
+                self.samples = deque([self.samples[-1]], maxlen=self.samples.maxlen)
+
+    def velocity(self):
+        # Raw units per second from the oldest and newest sample
+        with self.lock:
+            if len(self.samples)<2:
+                return 0., 0.
+            t0, ra0, dec0 = self.samples[0]
+            t1, ra1, dec1 = self.samples[-1]
+        if t1<=t0:
+            return 0., 0.
+        return ra_diff(ra1, ra0)/(t1-t0), (dec1-dec0)/(t1-t0)
+
+    def estimate(self, t=None):
+        if t is None:
+            t = time.time()
+        vra, vdec = self.velocity()
+        with self.lock:
+            if len(self.samples)==0:
+                return None
+            t1, ra, dec = self.samples[-1]
+            target = self.target
+        dt = min(max(t-t1, 0.), self.horizon)
+        dra, ddec = vra*dt, vdec*dt
+        if target is not None:
+            # Don't move past the target on either axis, nor away from it once there
+            tra, tdec = ra_diff(target[0], ra), target[1]-dec
+            if dra*tra>=0 and abs(dra)>abs(tra):
+                dra = tra
+            if ddec*tdec>=0 and abs(ddec)>abs(tdec):
+                ddec = tdec
+        return int(round(ra+dra)) % RA_WRAP, int(round(dec+ddec))
@@ -0,0 +1,227 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Network server for the Stellarium (10001) and auto alignment (10002) ports
+#
+# Both listeners and all client connections share one select() loop on a
+# single thread. The loop sleeps until a socket is readable, so an idle
+# server costs no CPU. Handlers must not block: serial commands return
+# futures, anything slower goes to the worker thread via defer().
+import os
+import socket
+import struct
+import select
+import time
+import threading
+from collections import deque
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class Connection(object):
+    def __init__(self, sock, addr, kind):
+        self.sock = sock
+        self.addr = addr
+        self.kind = kind        # "stellarium" or "autoalignment"
+        self.buf = b""
+        self.outbox = deque()   # messages waiting to be sent, filled by other threads
+        self.wbuf = b""         # partially sent message
+        self.stalled = False
+
+
+class NetServer(object):
+    def __init__(self, telescope, host="127.0.0.1", stellarium_port=10001, autoalignment_port=10002, max_queue=20):
+        self.telescope = telescope
+        self.max_queue = max_queue  # clients with more unsent messages than this are dropped
+        self.host = host
+        self.ports = {"stellarium": stellarium_port, "autoalignment": autoalignment_port}
+        self.listeners = {"stellarium": None, "autoalignment": None}
+        self.connections = {}   # socket -> Connection
+        self.jobs = queue.Queue()
+        self._wake_r, self._wake_w = os.pipe()
+        self._stop = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.worker = threading.Thread(target=self._work)
+        self.worker.daemon = True
+
+    def start(self):
+        self.thread.start()
+        self.worker.start()
+
+    def close(self):
+        self._stop = True
+        self.wake()
+        self.jobs.put(None)
+        self.thread.join(1.)
+        self.worker.join(1.)
+        for sock in list(self.connections.keys()) + list(self.listeners.values()):
+            if sock is not None:
+                try:
+                    sock.close()
+                except:
+                    pass
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def wake(self):
+        # Interrupt select() from another thread
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+
+    def defer(self, fn, *args):
+        # Run a blocking job (e.g. moving the focus stepper) off the loop
+        self.jobs.put((fn, args))
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:
+                self.telescope.message("ERROR: %s" % e)
+
+    def broadcast(self, kind, data):
+        # Queue data for every client of the given kind. Never blocks: the
+        # loop does the sending, and a client which falls too far behind is
+        # dropped instead of holding up the caller.
+        queued = False
+        for conn in self.clients(kind):
+            if len(conn.outbox) >= self.max_queue:
+                conn.stalled = True
+            else:
+                conn.outbox.append(data)
+            queued = True
+        if queued:
+            self.wake()
+
+    def send_position(self, ra, dec):
+        # Packed once for all Stellarium clients
+        data = struct.pack('<hhQIii',24,0,int(round(time.time() * 1000)), ra, dec, 0)
+        self.broadcast("stellarium", data)
+
+    def clients(self, kind):
+        return [c for c in list(self.connections.values()) if c.kind == kind]
+
+    def _listen(self):
+        for kind, port in self.ports.items():
+            if self.listeners[kind] is not None:
+                continue
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind((self.host, port))
+                sock.listen(5)
+                sock.setblocking(0)
+                self.listeners[kind] = sock
+            except socket.error as e:
+                self.telescope.message("%s socket error (%s)" % (kind.capitalize(), e.strerror))
+                sock.close()
+
+    def run(self):
+        while self._stop==False:
+            self._listen()
+            listening = [s for s in self.listeners.values() if s is not None]
+            # Retry failed listeners once a second, otherwise sleep until something happens
+            timeout = None if len(listening)==len(self.listeners) else 1.
+            readers = [self._wake_r] + listening + list(self.connections.keys())
+            writers = [c.sock for c in self.connections.values() if len(c.wbuf) or len(c.outbox)]
+            try:
+                ready, writable = select.select(readers, writers, [], timeout)[0:2]
+            except (select.error, OSError, ValueError):
+                continue
+            for w in writable:
+                if w in self.connections:
+                    self._write(self.connections[w])
+            for conn in list(self.connections.values()):
+                if conn.stalled:
+                    self.telescope.message("%s client %s:%d is not keeping up. Disconnected." % ((conn.kind.capitalize(),)+conn.addr[0:2]))
+                    self.drop(conn)
+            for r in ready:
+                if r == self._wake_r:
+                    os.read(self._wake_r, 512)
+                elif r in listening:
+                    self._accept(r)
+                elif r in self.connections:
+                    try:
+                        self._read(self.connections[r])
+                    except Exception as e:
+                        # A malformed message must not take the server down
+                        self.telescope.message("ERROR: %s" % e)
+
+    def _accept(self, listener):
+        kind = [k for k, s in self.listeners.items() if s is listener][0]
+        try:
+            sock, addr = listener.accept()
+        except socket.error:
+            return
+        sock.setblocking(0)
+        self.connections[sock] = Connection(sock, addr, kind)
+
+    def drop(self, conn):
+        self.connections.pop(conn.sock, None)
+        try:
+            conn.sock.close()
+        except:
+            pass
+
+    def _write(self, conn):
+        if len(conn.wbuf)==0:
+            while len(conn.outbox):
+                conn.wbuf += conn.outbox.popleft()
+        try:
+            n = conn.sock.send(conn.wbuf)
+        except socket.error:
+            # Dead peer
+            self.drop(conn)
+            return
+        conn.wbuf = conn.wbuf[n:]
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(2048)
+        except socket.error:
+            return
+        if len(data)==0:
+            # Disconnected
+            if conn.kind == "stellarium":
+                self.telescope.message("Stellarium disconnected.")
+            self.drop(conn)
+            return
+        if conn.kind == "stellarium":
+            # Stellarium messages start with their length as a little endian short
+            conn.buf += data
+            while len(conn.buf)>=2:
+                length = struct.unpack('<h', conn.buf[0:2])[0]
+                if length<4 or length>1024:
+                    self.telescope.message("Unknown command received from stellarium. Length %d." % length)
+                    conn.buf = b""
+                    break
+                if len(conn.buf)<length:
+                    break
+                message, conn.buf = conn.buf[0:length], conn.buf[length:]
+                self.telescope.stellarium_command(message)
+        else:
+            self.telescope.autoalignment_command(data)
@@ -0,0 +1,263 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Dome, relays, cover servo, focus stepper and sensors
+#
+# Everything in here used to run inside the curses main loop. It now has
+# its own housekeeping thread, so dome safety and sensor reads keep going
+# whatever the front end is doing.
+import time
+import threading
+from ephemeris import Ephemeris
+from sensors import SensorIngester
+from stepper import Stepper
+try:
+    import smbus
+    i2cbus = smbus.SMBus(1)
+except:
+    i2cbus = None
+
+relaymap = [22,18,13,7,11,15,19]
+
+
+def read_word_2c(adr):
+    try:
+        high = i2cbus.read_byte_data(0x68, adr)
+        low = i2cbus.read_byte_data(0x68, adr+1)
+        val = (high << 8) + low
+        if (val >= 0x8000):
+            return -((65535 - val) + 1)
+        else:
+            return val
+    except:
+        return 0
+
+
+class Observatory(object):
+    def __init__(self, message=None, status=None, focusstepperinc=4, telemetry=None, ephemeris=None):
+        self.message = message if message is not None else (lambda value: None)
+        self.status = status if status is not None else (lambda key, value: None)
+        self.focusstepperinc = focusstepperinc
+        self.telemetry = telemetry
+        self.servostatus = 4.75
+        self.lastkey = None     # time of the last dome left/right command
+        self.stop_threads = False
+        self.thread = None
+        self.ephemeris = ephemeris if ephemeris is not None else Ephemeris()
+
+        try:
+            import RPi.GPIO as GPIO;
+            GPIO.setwarnings(False)
+            GPIO.setmode(GPIO.BOARD);
+            # Servo
+            GPIO.setup(16, GPIO.OUT)
+            GPIO.output(16, 1)
+            GPIO.setup(12, GPIO.OUT)
+            self.servoPWM = GPIO.PWM(12, 50)
+            self.servoPWM.start(100.)
+            # Stepper
+            GPIO.setup(29, GPIO.OUT)
+            GPIO.setup(31, GPIO.OUT)
+            GPIO.setup(33, GPIO.OUT)
+            GPIO.setup(37, GPIO.OUT)
+            GPIO.output(29, 0)
+            GPIO.output(31, 0)
+            GPIO.output(33, 0)
+            GPIO.output(37, 0)
+            # Relays
+            for n,pin in enumerate(relaymap):
+                GPIO.setup(pin, GPIO.OUT)
+                if n<4: # only turn off dome, not other equipment
+                    GPIO.output(pin, 1)
+            self.GPIO = GPIO
+        except:
+            print("cannot access GPIO ports")
+            self.GPIO = None
+
+        self.stepper = Stepper(self.GPIO, message=self.message, status=self.status, telemetry=telemetry)
+        self.sensors = SensorIngester()
+        self.sensor_line = None
+        self.sensor_time = None
+
+    def start(self):
+        self.updateDomeStatus()
+        self.status("Stepper (f/F)", "%d"%self.focussteppercount)
+        if self.GPIO is not None:
+            self.stepper.start()
+        self.sensors.start()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.stop_threads = True
+        if self.thread is not None:
+            self.thread.join(1.)
+        try:
+            for n,pin in enumerate(relaymap):
+                if n<4: # only turn off dome, not other equipment
+                    self.GPIO.output(pin, 1)
+            #GPIO.cleanup()
+        except:
+            pass
+        self.stepper.close()
+        self.sensors.stop()
+
+    def run(self):
+        # Housekeeping: dome safety, sensors and the time status line
+        while self.stop_threads==False:
+            if self.lastkey is not None and time.time()-self.lastkey > 0.4:
+                self.lastkey = None
+                try:
+                    self.GPIO.output(relaymap[0], 1)
+                    self.GPIO.output(relaymap[1], 1)
+                except:
+                    pass
+                self.updateDomeStatus()
+            self.read_sensors()
+            # Wait for next update
+            time.sleep(0.05)
+
+    def read_sensors(self):
+        siderial = self.ephemeris.lst_string()
+        r = self.sensors.snapshot(max_age=2.)
+        alt1, alt3, volt = r.alt1, r.alt3, r.volt
+        if self.telemetry is not None and (r.t_acc, r.t_volt) != self.sensor_time:
+            self.sensor_time = (r.t_acc, r.t_volt)
+            self.telemetry.record(alt1=alt1, alt3=alt3, volt=volt)
+
+        line = time.strftime("%H:%M:%S", time.gmtime())+" / "+siderial+ " / %6.3f / %6.3f / %6.1f" %(alt1,alt3,volt)
+        if line != self.sensor_line:
+            self.sensor_line = line
+            self.status('Time UTC/siderial/az/bank', line)
+
+    def dome(self, direction):
+        # left/right run while commands keep coming in, up/down toggle
+        if self.GPIO is None:
+            self.message("WARNING: cannot access GPIO ports")
+            return
+        GPIO = self.GPIO
+        if direction == "left":
+            GPIO.output(relaymap[0], 0)
+            self.lastkey = time.time()
+        elif direction == "right":
+            GPIO.output(relaymap[1], 0)
+            self.lastkey = time.time()
+        elif direction == "up":
+            if GPIO.input(relaymap[3])==1:
+                GPIO.output(relaymap[2], not GPIO.input(relaymap[2]))
+        elif direction == "down":
+            if GPIO.input(relaymap[2])==1:
+                GPIO.output(relaymap[3], not GPIO.input(relaymap[3]))
+        self.updateDomeStatus()
+
+    def toggle(self, n):
+        # 1: lights, 2: telescope, 3: camera
+        if self.GPIO is None:
+            self.message("WARNING: cannot access GPIO ports")
+            return
+        current = self.GPIO.input(relaymap[3+n])
+        self.GPIO.output(relaymap[3+n], not current)
+        self.updateDomeStatus()
+
+    def cover(self):
+        if self.GPIO is None:
+            self.message("WARNING: cannot access GPIO ports")
+            return
+        if self.servostatus == 10.:
+            self.servostatus = 4.75
+            self.message("Servo closing telescope")
+        else:
+            self.servostatus = 10.
+            self.message("Servo opening telescope")
+        thread = threading.Thread(target=self._move_servo)
+        thread.daemon = True
+        thread.start()
+
+    def _move_servo(self):
+        GPIO = self.GPIO
+        self.servoPWM.ChangeDutyCycle(self.servostatus)
+        time.sleep(.1)
+        GPIO.output(16, 0)
+        self.updateDomeStatus()
+        time.sleep(1.)
+        GPIO.output(16, 1)
+        time.sleep(.1)
+        self.servoPWM.ChangeDutyCycle(100.)
+
+    def focus(self, direction):
+        # f/F keys
+        self.stepperMove(direction*self.focusstepperinc)
+
+    @property
+    def focussteppercount(self):
+        return self.stepper.position
+
+    def stepperMove(self, inc):
+        # Queued, the stepper thread drives the motor
+        if self.GPIO is None:
+            self.message("WARNING: cannot access GPIO ports")
+            return
+        self.stepper.move(inc)
+
+    def updateDomeStatus(self):
+        GPIO = self.GPIO
+        dome = "---"
+        try:
+            if not GPIO.input(relaymap[0]):
+                dome = "<<<"
+            elif not GPIO.input(relaymap[1]):
+                dome = ">>>"
+            elif not GPIO.input(relaymap[2]):
+                dome = "^^^"
+            elif not GPIO.input(relaymap[3]):
+                dome = "vvv"
+        except:
+            pass
+
+        self.status("Dome movement",dome)
+
+        peri = ""
+        try:
+            if not GPIO.input(relaymap[4]):
+                peri += "on  /"
+            else:
+                peri += "off /"
+            if not GPIO.input(relaymap[5]):
+                peri += " on  /"
+            else:
+                peri += " off /"
+            if not GPIO.input(relaymap[6]):
+                peri += " on  /"
+            else:
+                peri += " off /"
+            if self.servostatus == 10.:
+                peri += " open"
+            else:
+                peri += " closed"
+        except:
+            pass
+
+        self.status("Lights/Scope/Camera/Cover",peri)
+
+        if self.telemetry is not None and GPIO is not None:
+            relays = 0
+            for n,pin in enumerate(relaymap):
+                if not GPIO.input(pin):     # relays are active low
+                    relays |= 1<<n
+            self.telemetry.record(relays=relays)
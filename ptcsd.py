@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Headless control daemon
+#
+# Runs telescope and observatory control without a terminal. Front ends
+# attach through the Unix socket, e.g. ./utsc-ptcs.py --attach
+import os
+import sys
+import time
+import signal
+import argparse
+from journal import Journal
+from controller import Controller
+from api import APIServer, default_socket
+
+
+def printMessage(value):
+    print(time.strftime("%H:%M:%S ") + value)
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    if os.uname()[0]=="Darwin":
+        default_port = '/dev/tty.usbserial'
+    else:
+        default_port = '/dev/ttyAMA0'
+    parser = argparse.ArgumentParser(description="UTSC | PTCS control daemon")
+    parser.add_argument("port", nargs="?", default=default_port, help="serial port of the telescope")
+    parser.add_argument("--socket", default=default_socket, help="path of the control API socket")
+    args = parser.parse_args()
+
+    journal = Journal().start()
+    controller = Controller(journal=journal)
+    controller.add_listener(message=printMessage)
+    controller.start(args.port)
+    server = APIServer(controller, path=args.socket)
+    server.start()
+    printMessage("Control API listening on %s" % args.socket)
+
+    stop = []
+    def shutdown(signum, frame):
+        stop.append(signum)
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    while len(stop)==0:
+        time.sleep(0.2)
+
+    printMessage("Shutting down")
+    server.close()
+    controller.close()
+    journal.stop()
@@ -0,0 +1,143 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Batched curses renderer
+#
+# Other threads only record what changed. The render thread draws all
+# changes at a fixed frame rate with noutrefresh()/doupdate(), so repeated
+# updates of a status line within one frame cost a single write and no
+# writer ever waits on the terminal.
+import curses
+import time
+import threading
+from collections import deque
+
+
+def thread_cpu_time():
+    # CPU time of the calling thread where available (python 3.7+),
+    # otherwise wall time, which is an upper bound.
+    try:
+        return time.thread_time()
+    except AttributeError:
+        return time.time()
+
+
+class Renderer(object):
+    def __init__(self, statuswin, statusitems, messageswin, messagesN, lock, fps=10.):
+        self.statuswin = statuswin
+        self.statusitems = statusitems
+        self.statustitlelen = max([len(k) for k in statusitems])
+        self.messageswin = messageswin
+        self.messagesN = messagesN
+        self.curses_lock = lock     # held while drawing, shared with the input thread
+        self.fps = fps
+        self.messages = deque(maxlen=messagesN)
+        self.messagesi = 0          # number of the newest message
+        self.lock = threading.Lock()    # protects the dirty state below, never held during terminal I/O
+        self.dirty_status = {}
+        self.new_messages = deque(maxlen=messagesN)     # only the newest messagesN can be on screen
+        self.new_messagesN = 0
+        self.cpu = 0.               # renderer CPU seconds per second, updated every second
+        self._stop = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop = True
+        self.thread.join(1.)
+
+    def status(self, key, value):
+        with self.lock:
+            self.dirty_status[key] = value
+
+    def message(self, value):
+        with self.lock:
+            self.new_messages.append(value)
+            self.new_messagesN += 1
+
+    def run(self):
+        busy, window_start = 0., time.time()
+        while self._stop==False:
+            frame_start = time.time()
+            t0 = thread_cpu_time()
+            self.flush()
+            busy += thread_cpu_time()-t0
+            if frame_start-window_start >= 1.:
+                self.cpu = busy/(frame_start-window_start)
+                busy, window_start = 0., frame_start
+                if "Renderer CPU" in self.statusitems:
+                    self.status("Renderer CPU", "%.2f ms/s" % (self.cpu*1e3))
+            time.sleep(max(0., 1./self.fps-(time.time()-frame_start)))
+
+    def flush(self):
+        with self.lock:
+            dirty_status, self.dirty_status = self.dirty_status, {}
+            new_messages, self.new_messages = self.new_messages, deque(maxlen=self.messagesN)
+            new_messagesN, self.new_messagesN = self.new_messagesN, 0
+        if len(dirty_status)==0 and len(new_messages)==0:
+            return
+        with self.curses_lock:
+            if len(dirty_status):
+                self._draw_status(dirty_status)
+                self.statuswin.noutrefresh()
+            if len(new_messages):
+                self._draw_messages(new_messages, new_messagesN)
+                self.messageswin.noutrefresh()
+            curses.doupdate()
+
+    def _draw_status(self, dirty_status):
+        for index, key in enumerate(self.statusitems):
+            if key in dirty_status:
+                value = dirty_status[key]
+                self.statuswin.move(1+index, 5+self.statustitlelen)
+                self.statuswin.clrtoeol()
+                try:
+                    self.statuswin.addstr(1+index, 5+self.statustitlelen, value.replace('\n', ' '))
+                except:
+                    self.statuswin.addstr(1+index, 5+self.statustitlelen, "Cannot display string")
+        self.statuswin.border(0)
+        self.statuswin.addstr(0, 1, " Status ")
+
+    def _draw_messages(self, new_messages, new_messagesN):
+        # Newest message is at the top. Existing lines are shifted down with
+        # insdelln() so only the new lines need to be drawn.
+        self.messages.extend(new_messages)
+        self.messagesi += new_messagesN
+        n = len(new_messages)
+        if n < self.messagesN:
+            self.messageswin.move(1, 0)
+            self.messageswin.insdelln(n)
+        for index in range(n):
+            key = self.messages[-1-index]
+            self.messageswin.move(1+index, 2)
+            self.messageswin.clrtoeol()
+            self.messageswin.addstr(1+index, 2, "%4d : " % (self.messagesi-index))
+            try:
+                if "ERROR" in key:
+                    self.messageswin.addstr(1+index, 2+7, key, curses.A_STANDOUT)
+                elif "WARNING" in key:
+                    self.messageswin.addstr(1+index, 2+7, key, curses.A_BOLD)
+                else:
+                    self.messageswin.addstr(1+index, 2+7, key)
+            except:
+                self.messageswin.addstr(1+index, 2+7, "Cannot display string")
+        self.messageswin.border(0)
+        self.messageswin.addstr(0, 1, " Log ")
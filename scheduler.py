@@ -0,0 +1,258 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Observation scheduler
+#
+# Orders a queue of targets so that as little of the night as possible is
+# spent slewing or waiting for targets to rise, then runs the plan: goto,
+# wait until the mount has settled, take the exposures, next.
+# Planning is greedy (cheapest next target from the current pointing)
+# followed by 2-opt passes over the whole sequence. Every candidate order
+# is simulated on the clock, so altitude and time windows are respected.
+#
+# Usage: ./scheduler.py TARGETS.json           print the plan
+#        ./scheduler.py TARGETS.json --run     send it to ptcsd.py
+# TARGETS.json is a list like
+#   [{"name": "M13", "exposure": 30, "count": 20},
+#    {"ra": 83.82, "dec": -5.39, "exposure": 10, "count": 5, "min_alt": 25}]
+# with coordinates in degrees (equinox of date) or a catalog name.
+import os
+import sys
+import time
+import json
+import threading
+import subprocess
+from conversions import ra_raw2str, dec_raw2str
+from conversions_array import ra_deg2raw, dec_deg2raw
+
+
+class Target(object):
+    def __init__(self, name, ra, dec, exposure, count=1, iso="3200", min_alt=30., start=None, end=None):
+        self.name = name
+        self.ra = float(ra)             # degrees, equinox of date
+        self.dec = float(dec)
+        self.exposure = float(exposure) # seconds per frame
+        self.count = int(count)
+        self.iso = str(iso)
+        self.min_alt = float(min_alt)
+        self.start = start              # unix times, optional
+        self.end = end
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class Scheduler(object):
+    def __init__(self, ephemeris, slew=3., settle=5., readout=8., wait_step=300.):
+        self.ephemeris = ephemeris
+        self.slew = slew            # degrees per second and axis
+        self.settle = settle        # expected settle time after each slew [s]
+        self.readout = readout      # seconds per frame for download and conversion
+        self.wait_step = wait_step  # resolution when waiting for a target to rise
+
+    def slew_time(self, a, b):
+        # Both axes move at the same time, RA the short way round
+        if a is None:
+            return 0.
+        dra = abs((b[0]-a[0]+180.) % 360. - 180.)
+        ddec = abs(b[1]-a[1])
+        return max(dra, ddec)/self.slew + self.settle
+
+    def duration(self, target):
+        return target.count*(target.exposure+self.readout)
+
+    def observable(self, target, t):
+        # Whole exposure block inside the time window and above min_alt
+        end = t + self.duration(target)
+        if target.start is not None and t < target.start:
+            return False
+        if target.end is not None and end > target.end:
+            return False
+        return (self.ephemeris.altitude(target.ra, target.dec, t) >= target.min_alt and
+                self.ephemeris.altitude(target.ra, target.dec, end) >= target.min_alt)
+
+    def earliest(self, target, t, deadline):
+        # First start time >= t at which target can be observed, None if not before deadline
+        if target.start is not None and t < target.start:
+            t = target.start
+        while t + self.duration(target) <= deadline:
+            if self.observable(target, t):
+                return t
+            t += self.wait_step
+        return None
+
+    def simulate(self, order, pointing, t0, deadline):
+        # Returns (plan, end time). plan has (target, slew start, exposure start) for
+        # every target which fits, the others are skipped.
+        plan, t = [], t0
+        for target in order:
+            arrive = t + self.slew_time(pointing, (target.ra, target.dec))
+            start = self.earliest(target, arrive, deadline)
+            if start is None:
+                continue
+            plan.append((target, start - (arrive-t), start))
+            t = start + self.duration(target)
+            pointing = (target.ra, target.dec)
+        return plan, t
+
+    def score(self, plan, end, t0):
+        # Observing time first, then the earliest finish
+        return (-sum(self.duration(p[0]) for p in plan), end-t0)
+
+    def plan(self, targets, pointing=None, t0=None, deadline=None):
+        t0 = time.time() if t0 is None else t0
+        if deadline is None:
+            night = self.ephemeris.night(t0)
+            dawn = night["nautical"][1] if night["nautical"] is not None else None
+            deadline = dawn if dawn is not None and dawn > t0 else t0+12*3600
+        # Greedy: cheapest next target, ties go to the one setting first
+        order, remaining, t, p = [], list(targets), t0, pointing
+        while len(remaining):
+            best = None
+            for target in remaining:
+                arrive = t + self.slew_time(p, (target.ra, target.dec))
+                start = self.earliest(target, arrive, deadline)
+                if start is None:
+                    continue
+                sets = self.ephemeris.target(target.ra, target.dec, t)["set"] or deadline
+                key = (start-t, sets)
+                if best is None or key < best[0]:
+                    best = (key, target, start)
+            if best is None:
+                break
+            key, target, start = best
+            order.append(target)
+            remaining.remove(target)
+            t, p = start + self.duration(target), (target.ra, target.dec)
+        order += remaining      # retried by 2-opt, may fit in a different order
+        # 2-opt
+        plan, end = self.simulate(order, pointing, t0, deadline)
+        best_score = self.score(plan, end, t0)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(order)-1):
+                for j in range(i+1, len(order)):
+                    candidate = order[:i] + order[i:j+1][::-1] + order[j+1:]
+                    cplan, cend = self.simulate(candidate, pointing, t0, deadline)
+                    cscore = self.score(cplan, cend, t0)
+                    if cscore < best_score:
+                        order, plan, best_score, improved = candidate, cplan, cscore, True
+        return plan
+
+
+def capture_takeimages(target, stop):
+    # Default camera: the takeimages.py script
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "takeimages.py")
+    return subprocess.call([sys.executable, path, "%g"%target.exposure, "%d"%target.count, target.iso]) == 0
+
+
+class ScheduleRunner(object):
+    # Executes a plan on a Controller in a background thread
+    def __init__(self, controller, scheduler, capture=capture_takeimages, timeout=300.):
+        self.controller = controller
+        self.scheduler = scheduler
+        self.capture = capture
+        self.timeout = timeout      # longest slew before a target is given up
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.frames = 0
+        self.started = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, targets):
+        if self.running():
+            raise RuntimeError("Schedule already running")
+        plan = self.scheduler.plan(targets, self.controller.pointing())
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, args=(plan,))
+        self.thread.daemon = True
+        self.thread.start()
+        return plan
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(5.)
+
+    def wait_on_target(self, target):
+        future = self.controller.settled()
+        deadline = time.time()+self.timeout
+        while time.time() < deadline and not self.stop_event.is_set():
+            if future.result(0.5) is not None:
+                return True
+        return False
+
+    def run(self, plan):
+        message = self.controller.message
+        self.started, self.frames = time.time(), 0
+        self.controller.goto_mode()
+        for target, slew_start, start in plan:
+            if self.stop_event.wait(max(0., slew_start-time.time())):
+                break
+            message("Schedule: %s (%d x %gs)" % (target.name, target.count, target.exposure))
+            self.controller.goto(ra_raw2str(int(ra_deg2raw(target.ra))), dec_raw2str(int(dec_deg2raw(target.dec))))
+            if not self.wait_on_target(target):
+                message("Schedule: %s not reached, skipped" % target.name)
+                continue
+            if self.stop_event.wait(max(0., start-time.time())):
+                break
+            if self.capture(target, self.stop_event):
+                self.frames += target.count
+            else:
+                message("Schedule: capture of %s failed" % target.name)
+        hours = (time.time()-self.started)/3600.
+        message("Schedule finished: %d frames in %.2f h (%.1f per hour)" % (self.frames, hours, self.frames/hours if hours>0 else 0.))
+
+
+def targets_from_dicts(items, catalog=None):
+    targets = []
+    for item in items:
+        item = dict(item)
+        if "ra" not in item:
+            if catalog is None:
+                raise ValueError("Target without coordinates")
+            i = catalog.lookup(item["name"])
+            if i is None:
+                raise ValueError("Unknown object %s" % item["name"])
+            ra, dec = catalog.coordinates_deg(i)
+            item.setdefault("ra", ra)
+            item.setdefault("dec", dec)
+        item.setdefault("name", "%.3f %+.3f" % (item["ra"], item["dec"]))
+        targets.append(Target(**item))
+    return targets
+
+
+if __name__ == "__main__":
+    if len(sys.argv)<2:
+        print("Usage: ./scheduler.py TARGETS.json [--run]")
+        exit(-1)
+    with open(sys.argv[1]) as f:
+        items = json.load(f)
+    if "--run" in sys.argv:
+        from api import APIClient
+        plan = APIClient().schedule(items)
+    else:
+        from catalog import Catalog
+        from ephemeris import Ephemeris
+        plan = [(p[0].to_dict(), p[1], p[2]) for p in Scheduler(Ephemeris()).plan(targets_from_dicts(items, Catalog()))]
+    for target, slew_start, start in plan:
+        print("%s  %-20s %3d x %5gs" % (time.strftime("%H:%M", time.localtime(start)), target["name"], target["count"], target["exposure"]))
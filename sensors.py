@@ -0,0 +1,140 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## UDP sensor ingestion
+#
+# wirelessac.ino sends the raw MPU-6050 accelerometer registers to port
+# 8086 (three big endian int16, 16384 per g), wirelessadc.ino sends the
+# bank voltage ADC reading to port 8087 (big endian uint16, 52.5 per V).
+# Both send about ten packets a second. A background thread drains
+# everything that is queued, decodes whole batches with numpy and keeps a
+# moving average over the last samples. The result is published as an
+# immutable Reading; readers just take self.latest, no locking needed.
+import time
+import select
+import socket
+import threading
+from collections import namedtuple
+import numpy as np
+
+Reading = namedtuple("Reading", ["t_acc", "alt1", "alt2", "alt3", "t_volt", "volt"])
+
+accel_dtype = np.dtype(">i2")
+voltage_dtype = np.dtype(">u2")
+
+
+def decode_accelerations(packets):
+    # List of datagrams -> (n,3) array of normalized acceleration vectors
+    data = b"".join(p[0:6] for p in packets if len(p)>=6)
+    acc = np.frombuffer(data, dtype=accel_dtype).reshape(-1, 3)/16384.0
+    n = np.sqrt((acc*acc).sum(axis=1))
+    acc = acc[n>0.]/n[n>0.][:,None]
+    return acc
+
+def decode_voltages(packets):
+    data = b"".join(p[0:2] for p in packets if len(p)>=2)
+    return np.frombuffer(data, dtype=voltage_dtype)/52.50
+
+def altitudes(acc):
+    # Angles in degrees of the three sensor axes against the horizontal
+    acc = np.atleast_2d(acc)
+    x, y, z = acc[:,0], acc[:,1], acc[:,2]
+    alt1 = np.degrees(np.arctan2(-x, np.sqrt(y*y+z*z)))
+    alt2 = np.degrees(np.arctan2(-y, np.sqrt(z*z+x*x)))
+    alt3 = np.degrees(np.arctan2(-z, np.sqrt(x*x+y*y)))
+    return alt1, alt2, alt3
+
+
+class SensorIngester(object):
+    def __init__(self, acceleration_port=8086, voltage_port=8087, window=10):
+        self.window = window
+        self.acc_history = np.zeros((0,3))
+        self.volt_history = np.zeros(0)
+        self.latest = Reading(None, 0., 0., 0., None, -1.)
+        self.received = 0
+        self._stop = False
+        self.acceleration_socket = self._bind(acceleration_port)
+        self.voltage_socket = self._bind(voltage_port)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def _bind(self, port):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1<<18)   # room for bursts while we are busy
+        s.bind(("",port))
+        s.setblocking(0)
+        return s
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self.thread.join(1.)
+        self.acceleration_socket.close()
+        self.voltage_socket.close()
+
+    def snapshot(self, max_age=None):
+        # Readings older than max_age seconds are reported as missing (0 / -1), as before
+        r = self.latest
+        if max_age is not None:
+            now = time.time()
+            if r.t_acc is None or now-r.t_acc > max_age:
+                r = r._replace(alt1=0., alt2=0., alt3=0.)
+            if r.t_volt is None or now-r.t_volt > max_age:
+                r = r._replace(volt=-1.)
+        return r
+
+    def drain(self, sock):
+        packets = []
+        while True:
+            try:
+                packets.append(sock.recv(4096))
+            except socket.error:
+                return packets
+
+    def run(self):
+        sockets = [self.acceleration_socket, self.voltage_socket]
+        while self._stop==False:
+            try:
+                ready = select.select(sockets, [], [], 0.5)[0]
+            except (select.error, ValueError):
+                return
+            if len(ready)==0:
+                continue
+            self.ingest(self.drain(self.acceleration_socket) if self.acceleration_socket in ready else [],
+                        self.drain(self.voltage_socket) if self.voltage_socket in ready else [])
+
+    def ingest(self, acc_packets, volt_packets, t=None):
+        t = time.time() if t is None else t
+        latest = self.latest
+        if len(acc_packets):
+            acc = decode_accelerations(acc_packets)
+            if len(acc):
+                self.acc_history = np.concatenate((self.acc_history, acc))[-self.window:]
+                mean = self.acc_history.mean(axis=0)
+                alt1, alt2, alt3 = altitudes(mean)
+                latest = latest._replace(t_acc=t, alt1=float(alt1[0]), alt2=float(alt2[0]), alt3=float(alt3[0]))
+        if len(volt_packets):
+            volt = decode_voltages(volt_packets)
+            if len(volt):
+                self.volt_history = np.concatenate((self.volt_history, volt))[-self.window:]
+                latest = latest._replace(t_volt=t, volt=float(self.volt_history.mean()))
+        self.received += len(acc_packets)+len(volt_packets)
+        self.latest = latest
@@ -0,0 +1,103 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Goto settle detection
+#
+# Fed with every polled position (!CGra/!CGde) and, when known, the
+# controller's target (!CGtr/!CGtd or the coordinates of the last goto).
+# The mount counts as settled once `samples` consecutive positions are
+# within `tolerance` of the target and have moved less than `tolerance`
+# since the previous one. Positions are raw units, see conversions.py.
+import time
+import threading
+from atcl import ATCLFuture
+from motion import ra_diff
+
+arcsec = 4294967296./1296000.   # raw units per arcsecond, same for RA and Dec
+
+
+class SettleDetector(object):
+    def __init__(self, tolerance=30., samples=2, on_change=None):
+        self.tolerance = tolerance*arcsec
+        self.samples = samples
+        self.on_change = on_change  # called with True (settled) or False (slewing)
+        self.lock = threading.Lock()
+        self.target = None
+        self.last = None
+        self.count = 0
+        self.settled = False
+        self.since = None           # time of the last change of state
+        self._future = ATCLFuture("settle")
+
+    def goto(self, ra, dec):
+        # A new goto was sent: slewing until proven otherwise
+        with self.lock:
+            self.target = (ra, dec)
+            self.count = 0
+            changed = self._set(False)
+        self._notify(changed)
+
+    def update(self, ra, dec, target_ra=None, target_dec=None, t=None):
+        t = time.time() if t is None else t
+        with self.lock:
+            if target_ra is not None and target_dec is not None:
+                self.target = (target_ra, target_dec)
+            stable = self.last is not None and self._close((ra, dec), self.last)
+            on_target = self.target is None or self._close((ra, dec), self.target)
+            self.last = (ra, dec)
+            self.count = self.count+1 if stable and on_target else 0
+            changed = self._set(self.count >= self.samples, t)
+        self._notify(changed)
+
+    def _close(self, a, b):
+        return abs(ra_diff(a[0], b[0])) <= self.tolerance and abs(a[1]-b[1]) <= self.tolerance
+
+    def _set(self, settled, t=None):
+        if settled == self.settled:
+            return None
+        self.settled = settled
+        self.since = time.time() if t is None else t
+        if settled:
+            future = self._future
+        else:
+            future = None
+            if self._future.done():
+                self._future = ATCLFuture("settle")
+        return settled, future
+
+    def _notify(self, changed):
+        if changed is None:
+            return
+        settled, future = changed
+        if future is not None:
+            future.set_result(self.since)
+        if self.on_change is not None:
+            self.on_change(settled)
+
+    def future(self):
+        # Resolves with the settle time once the current (or next) slew is over
+        with self.lock:
+            if self.settled:
+                future = ATCLFuture("settle")
+                future.set_result(self.since)
+                return future
+            return self._future
+
+    def wait(self, timeout=None):
+        # Blocks until settled, returns False on timeout
+        return self.future().result(timeout) is not None
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Simulated SkyWalker controller on a pseudo terminal
+#
+# Usage: ./simulator.py [--latency SEC] [--slew DEG_PER_SEC] [--nack P] [--drop P]
+# Then start utsc-ptcs.py or debug.py with the printed port name.
+import os
+import time
+import tty
+import random
+import select
+import threading
+import argparse
+from conversions import *
+
+ATCL_ACK = chr(0x8F)
+ATCL_NACK = chr(0xA5)
+ATCL_SYNTAX_ERROR = chr(0x9E)
+ATCL_ASYNCH = chr(0x9F)
+
+
+class SkyWalkerSimulator(object):
+    def __init__(self, latency=0.02, slew=3., nack=0., drop=0., asynch=None, seed=None):
+        self.latency = latency  # seconds between command and response
+        self.slew = slew        # slew speed per axis in degrees per second
+        self.nack = nack        # probability of answering with ATCL_NACK
+        self.drop = drop        # probability of not answering at all
+        self.asynch = asynch    # interval of unsolicited status messages in seconds
+        self.random = random.Random(seed)
+
+        self.ra, self.dec = 0., 0.                      # hours, degrees
+        self.target_ra, self.target_dec = 0., 0.
+        self.slewing = False
+        self.slew_time = time.time()
+        self.alignment_state = "Not aligned"
+        self.alignment_side = "East"
+        self.commands = 0
+        self.on_command = None  # called with (command, time received), e.g. by benchmark.py
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port_name = os.ttyname(self.slave)
+        self.write_lock = threading.Lock()
+        self._stop = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self.thread.join(1.)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def write(self, data):
+        with self.write_lock:
+            os.write(self.master, data.encode('latin-1') if not isinstance(data, bytes) else data)
+
+    def goto(self, ra, dec):
+        self._update()
+        self.target_ra, self.target_dec = ra, dec
+        self.slewing = True
+
+    def position(self):
+        self._update()
+        return self.ra, self.dec
+
+    def _update(self):
+        # Move both axes towards the target at the configured slew speed
+        now = time.time()
+        dt = now - self.slew_time
+        self.slew_time = now
+        if not self.slewing:
+            return
+        step = self.slew*dt
+        dra = ((self.target_ra - self.ra + 12.) % 24. - 12.)*15.
+        ddec = self.target_dec - self.dec
+        if abs(dra) <= step:
+            self.ra = self.target_ra
+        else:
+            self.ra = (self.ra + (step if dra>0 else -step)/15.) % 24.
+        if abs(ddec) <= step:
+            self.dec = self.target_dec
+        else:
+            self.dec += step if ddec>0 else -step
+        if self.ra == self.target_ra and self.dec == self.target_dec:
+            self.slewing = False
+            self.write(ATCL_ASYNCH + "Goto complete;")
+
+    def _run(self):
+        buf = ""
+        last_asynch = time.time()
+        while self._stop==False:
+            ready = select.select([self.master], [], [], 0.05)
+            if ready[0]:
+                try:
+                    data = os.read(self.master, 2048)
+                except OSError:
+                    continue
+                if not isinstance(data, str):
+                    data = data.decode('latin-1')
+                buf += data
+                while ";" in buf:
+                    cmd, buf = buf.split(";", 1)
+                    self.commands += 1
+                    if self.on_command is not None:
+                        self.on_command(cmd.strip(), time.time())
+                    time.sleep(self.latency)
+                    response = self.respond(cmd.strip())
+                    if response is not None:
+                        self.write(response)
+            self._update()
+            if self.asynch is not None and time.time()-last_asynch > self.asynch:
+                last_asynch = time.time()
+                self.write(ATCL_ASYNCH + "O7 Status %d;" % self.commands)
+
+    def respond(self, cmd):
+        if self.random.random() < self.drop:
+            return None
+        if self.random.random() < self.nack:
+            return ATCL_NACK
+        if len(cmd)<2 or cmd[0]!="!":
+            return ATCL_SYNTAX_ERROR
+        cmd = cmd[1:]
+        ra, dec = self.position()
+        if cmd == "AGas":
+            return self.alignment_state + ";"
+        elif cmd == "AGai":
+            return self.alignment_side + ";"
+        elif cmd == "CGra":
+            return ra_raw2str(int(ra/12.*2147483648.)) + ";"
+        elif cmd == "CGde":
+            return dec_raw2str(int(dec/90.*1073741824.)) + ";"
+        elif cmd == "CGtr":
+            return ra_raw2str(int(self.target_ra/12.*2147483648.)) + ";"
+        elif cmd == "CGtd":
+            return dec_raw2str(int(self.target_dec/90.*1073741824.)) + ";"
+        elif cmd.startswith("CStr"):
+            try:
+                self.target_ra = ra_str2raw(cmd[4:])/2147483648.*12.
+            except:
+                return ATCL_NACK
+            return ATCL_ACK
+        elif cmd.startswith("CStd"):
+            try:
+                self.target_dec = dec_str2raw(cmd[4:])/1073741824.*90.
+            except:
+                return ATCL_NACK
+            return ATCL_ACK
+        elif cmd == "GTrd":
+            self.goto(self.target_ra, self.target_dec)
+            return ATCL_ACK
+        elif cmd == "AFrn":
+            self.ra, self.dec = self.target_ra, self.target_dec
+            self.slewing = False
+            self.alignment_state = "Aligned"
+            return ATCL_ACK
+        elif cmd.startswith("ASas"):
+            if cmd[4:] not in ["East", "West"]:
+                return ATCL_NACK
+            self.alignment_side = cmd[4:]
+            return ATCL_ACK
+        return ATCL_SYNTAX_ERROR
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated SkyWalker controller on a pseudo terminal.")
+    parser.add_argument("--latency", type=float, default=0.02, help="response latency in seconds")
+    parser.add_argument("--slew", type=float, default=3., help="slew speed in degrees per second")
+    parser.add_argument("--nack", type=float, default=0., help="probability of a NACK response")
+    parser.add_argument("--drop", type=float, default=0., help="probability of a lost response")
+    parser.add_argument("--asynch", type=float, default=None, help="interval of asynchronous messages in seconds")
+    args = parser.parse_args()
+    sim = SkyWalkerSimulator(args.latency, args.slew, args.nack, args.drop, args.asynch).start()
+    print("Simulated SkyWalker controller on %s" % sim.port_name)
+    print("Run ./utsc-ptcs.py %s" % sim.port_name)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    sim.stop()
@@ -0,0 +1,363 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Plate solving with astrometry.net
+#
+# PlateSolver runs solve-field on a downsized copy of the image. With a
+# hint (where the mount thinks it points, from !CGra/!CGde) the search is
+# limited to `radius` degrees around it, so only the index tiles there
+# are looked at; if that fails it falls back to the blind search of the
+# whole sky. Run as a service (./solver.py --serve) the index files that
+# solve-field can use for this field size stay memory-mapped and are
+# touched every few minutes, so they are in the page cache instead of
+# being read from the SD card on every solve.
+# The service speaks the control API protocol (api.py) on its own socket.
+#
+# Usage: ./solver.py --serve                        keep running for autoalignment.py
+#        ./solver.py IMAGE [--hint RA DEC]          solve once, degrees
+#        ./solver.py IMAGE --hint RA DEC --benchmark N
+#                                                   time hinted and blind solves
+import os
+import re
+import sys
+import mmap
+import time
+import glob
+import threading
+import subprocess
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+default_socket = "/tmp/utsc-ptcs-solver.sock"
+astrometry = "/usr/local/astrometry"
+
+
+def parse_wcs(path):
+    # CRVAL1/CRVAL2 (degrees) of a WCS header, None if there are none
+    ra, dec = None, None
+    try:
+        with open(path, 'rb') as f:
+            content = f.read().decode("ascii", "replace")
+    except (IOError, OSError):
+        return None
+    while len(content):
+        line = content[0:80]
+        content = content[80:]
+        s = line.split("=")
+        if len(s) == 2:
+            if s[0] == "CRVAL1  ":
+                ra = float(s[1].split("/")[0].strip())
+            if s[0] == "CRVAL2  ":
+                dec = float(s[1].split("/")[0].strip())
+        if line.startswith("END "):
+            break
+    if ra is None or dec is None:
+        return None
+    return ra, dec
+
+
+def index_files(config=os.path.join(astrometry, "etc", "astrometry.cfg")):
+    # Index files named in an astrometry.net config (add_path and index lines)
+    files = []
+    try:
+        with open(config) as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        lines = ["add_path %s" % os.path.join(astrometry, "data")]
+    paths = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 2 and fields[0] == "add_path":
+            paths.append(fields[1])
+        elif len(fields) == 2 and fields[0] == "index":
+            files.append(fields[1])
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, "*.fits")))
+    for i, f in enumerate(files):
+        if not os.path.isabs(f) and len(paths) and not os.path.exists(f):
+            files[i] = os.path.join(paths[0], f)
+    return [f for f in files if os.path.exists(f)]
+
+
+def index_scale(path):
+    # Range of quad sizes (arcmin) in an index file, from SCALE_L/SCALE_U in
+    # its header, or from the scale number in names like index-4208-03.fits.
+    # None if neither is there.
+    lo, hi = None, None
+    try:
+        with open(path, "rb") as f:
+            for block in range(10):
+                data = f.read(2880).decode("ascii", "replace")
+                cards = [data[i:i+80] for i in range(0, len(data), 80)]
+                for card in cards:
+                    s = card.split("=")
+                    if len(s) == 2 and s[0].strip() in ("SCALE_L", "SCALE_U"):
+                        value = float(s[1].split("/")[0].strip())/60.
+                        if s[0].strip() == "SCALE_L":
+                            lo = value
+                        else:
+                            hi = value
+                if len(data) < 2880 or any(card.startswith("END ") for card in cards):
+                    break
+    except (IOError, OSError, ValueError):
+        pass
+    if lo is not None and hi is not None:
+        return lo, hi
+    match = re.match(r"index-\d\d(\d\d)(-\d+)?\.fits$", os.path.basename(path))
+    if match is not None:
+        n = int(match.group(1))
+        return 2.*2.**(n/2.), 2.*2.**((n+1)/2.)
+    return None
+
+
+class IndexCache(object):
+    # Keeps index files mapped and their pages in the page cache
+    def __init__(self, files, refresh=300., message=None):
+        self.files = files
+        self.refresh = refresh
+        self.message = message if message is not None else (lambda value: None)
+        self.maps = []
+        self.bytes = 0
+        self.touched = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        for path in self.files:
+            try:
+                with open(path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size:
+                        self.maps.append(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
+                        self.bytes += size
+            except (IOError, OSError, ValueError) as e:
+                self.message("Cannot map index %s: %s" % (path, e))
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def touch(self):
+        page = mmap.PAGESIZE
+        for m in self.maps:
+            for offset in range(0, len(m), page):
+                m[offset]
+        self.touched = time.time()
+
+    def run(self):
+        while True:
+            t0 = time.time()
+            self.touch()
+            if self.touched-t0 > 1.:
+                self.message("Index files (%d MB) touched in %.1f s" % (self.bytes>>20, self.touched-t0))
+            if self.stop_event.wait(self.refresh):
+                return
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(5.)
+        for m in self.maps:
+            m.close()
+        self.maps = []
+
+
+class PlateSolver(object):
+    commands = ["solve", "get_status"]
+
+    def __init__(self, directory="images/astrometry", solve_field=os.path.join(astrometry, "bin", "solve-field"),
+                 scale=(30., 50.), radius=10., cpulimit=10, message=None):
+        self.directory = directory
+        self.solve_field = solve_field
+        self.scale = scale          # field width in arcmin
+        self.radius = radius        # degrees around a hint
+        self.cpulimit = cpulimit
+        self.message = message if message is not None else (lambda value: None)
+        self.listeners = []
+        self.lock = threading.Lock()    # one solve at a time, they share the directory
+        self.cache = None
+        self.solves = 0
+        self.last = None
+
+    def useful(self, path):
+        # solve-field only uses indexes with quads from 10% up to 100% of the field width
+        scale = index_scale(path)
+        return scale is not None and scale[1] >= 0.1*self.scale[0] and scale[0] <= self.scale[1]
+
+    def warm(self, files=None):
+        if files is None:
+            files = index_files()
+            skipped = len(files)
+            files = [f for f in files if self.useful(f)]
+            if skipped > len(files):
+                self._message("Not keeping %d index files warm, their quads do not fit a %g-%g arcmin field" % (skipped-len(files), self.scale[0], self.scale[1]))
+        self.cache = IndexCache(files, message=self._message)
+        self.cache.start()
+        self._message("Keeping %d index files (%d MB) warm" % (len(self.cache.maps), self.cache.bytes>>20))
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    # Used by api.APIServer
+    def add_listener(self, status=None, message=None):
+        if message is not None:
+            self.listeners.append(message)
+
+    def remove_listener(self, status=None, message=None):
+        if message in self.listeners:
+            self.listeners.remove(message)
+
+    def _message(self, value):
+        self.message(value)
+        for listener in list(self.listeners):
+            listener(value)
+
+    def get_status(self):
+        return {"indexes": 0 if self.cache is None else len(self.cache.maps),
+                "index MB": 0 if self.cache is None else self.cache.bytes>>20,
+                "solves": self.solves, "last": self.last}
+
+    def shrink(self, image, small):
+        if Image is not None:
+            im = Image.open(image)
+            im.draft("RGB", (800, 533))
+            im = im.convert("RGB")
+            im.thumbnail((800, 533))    # keeps the aspect ratio, as convert -resize does
+            im.save(small)
+        elif os.system("convert -resize 800x533 %s %s" % (image, small)) != 0:
+            raise IOError("Cannot resize %s" % image)
+
+    def run_solve_field(self, small, hint=None, radius=None):
+        # One solve-field run, returns (ra, dec) or None
+        base = os.path.splitext(os.path.basename(small))[0]
+        wcs = os.path.join(self.directory, base+".wcs")
+        if os.path.exists(wcs):
+            os.remove(wcs)
+        cmd = [self.solve_field, os.path.basename(small), "--overwrite", "--no-plots", "--new-fits", "none",
+               "-L", "%g" % self.scale[0], "-H", "%g" % self.scale[1], "-u", "arcminwidth",
+               "--parity", "neg", "--cpulimit", "%d" % self.cpulimit, "--crpix-center"]
+        if hint is not None:
+            cmd += ["--ra", "%.5f" % hint[0], "--dec", "%.5f" % hint[1], "--radius", "%g" % (radius or self.radius)]
+        with open(os.devnull, "w") as devnull:
+            subprocess.call(cmd, cwd=self.directory, stdout=devnull, stderr=devnull)
+        return parse_wcs(wcs)
+
+    def solve(self, image, hint_ra=None, hint_dec=None, radius=None):
+        # Solves image (path), returns a dict with ra, dec (degrees, None if it failed),
+        # hinted (whether the hinted search found it) and the time of every attempt
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            t0 = time.time()
+            small = os.path.join(self.directory, "latest_small.jpg")
+            self.shrink(image, small)
+            result = {"ra": None, "dec": None, "hinted": False, "attempts": []}
+            hints = [None]
+            if hint_ra is not None and hint_dec is not None:
+                hints = [(float(hint_ra), float(hint_dec)), None]
+            for hint in hints:
+                t = time.time()
+                solution = self.run_solve_field(small, hint, radius)
+                result["attempts"].append({"hint": hint is not None, "seconds": time.time()-t, "solved": solution is not None})
+                if solution is not None:
+                    result["ra"], result["dec"] = solution
+                    result["hinted"] = hint is not None
+                    break
+                if hint is not None:
+                    self._message("No solution within %g deg of the hint, trying blind" % (radius or self.radius))
+            result["seconds"] = time.time()-t0
+            self.solves += 1
+            self.last = result
+            return result
+
+
+def solve(image, hint=None, radius=None, path=default_socket):
+    # Through the service if it is running, otherwise in this process (cold)
+    args = [os.path.abspath(image)] + (list(hint) if hint is not None else [None, None]) + [radius]
+    try:
+        from api import APIClient
+        client = APIClient(path, timeout=600.)
+    except Exception:
+        client = None
+    if client is not None:
+        try:
+            return client.call("solve", *args)
+        finally:
+            client.close()
+    return PlateSolver().solve(*args)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Plate solving with astrometry.net")
+    parser.add_argument("image", nargs="?")
+    parser.add_argument("--serve", action="store_true", help="run as a service for autoalignment.py")
+    parser.add_argument("--socket", default=default_socket)
+    parser.add_argument("--hint", nargs=2, type=float, metavar=("RA", "DEC"), help="degrees")
+    parser.add_argument("--radius", type=float, default=None, help="search radius around the hint in degrees")
+    parser.add_argument("--benchmark", type=int, default=0, metavar="N", help="time N hinted and N blind solves")
+    parser.add_argument("--cold", action="store_true", help="benchmark without keeping the index files warm")
+    args = parser.parse_args()
+
+    def printMessage(value):
+        print(time.strftime("%H:%M:%S ") + value)
+        sys.stdout.flush()
+
+    if args.serve:
+        import signal
+        from api import APIServer
+        solver = PlateSolver(message=printMessage)
+        solver.warm()
+        server = APIServer(solver, args.socket)
+        server.start()
+        printMessage("Solver listening on %s" % args.socket)
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *a: stop.set())
+        try:
+            while not stop.wait(1.):
+                pass
+        except KeyboardInterrupt:
+            pass
+        server.close()
+        solver.close()
+    elif args.image is None:
+        parser.print_help()
+    elif args.benchmark:
+        if args.hint is None:
+            parser.error("--benchmark needs --hint")
+        solver = PlateSolver(message=printMessage)
+        if not args.cold:
+            solver.warm()
+        for name, hint in [("hinted", args.hint), ("blind", None)]:
+            times = []
+            for i in range(args.benchmark):
+                result = solver.solve(args.image, *(list(hint) if hint else [None, None]), radius=args.radius)
+                times.append(result["attempts"][0]["seconds"])
+                ok = result["attempts"][0]["solved"]
+            times.sort()
+            print("%-7s median %6.2f s  min %6.2f s  max %6.2f s  (%s)" % (name, times[len(times)//2], times[0], times[-1], "solved" if ok else "not solved"))
+        solver.close()
+    else:
+        result = solve(args.image, args.hint, args.radius, args.socket)
+        if result["ra"] is None:
+            print("Not solved (%.1f s)" % result["seconds"])
+            exit(-1)
+        print("RA %.5f  Dec %+.5f  (%s, %.1f s)" % (result["ra"], result["dec"], "hinted" if result["hinted"] else "blind", result["seconds"]))
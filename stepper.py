@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Focus stepper motion
+#
+# Moves are queued and driven by one thread, so the socket and curses
+# threads never wait for the motor. Consecutive moves in the same
+# direction are merged into one. Each move ramps linearly from the start
+# rate up to the cruise rate and back down. Phases are timed against
+# absolute deadlines, so a late wake-up doesn't delay the following
+# phases. The position is kept in memory and written to
+# .focussteppercount once the queue is empty, not after every move.
+#
+# One step is the full four phase cycle of the coils on pins 29/31/33/37
+# (A, A-, B, B-), as in the original stepperMove.
+#
+# ./stepper.py drives a MockGPIO, which records every output, and
+# compares step rate and timing jitter with the old sleep-based loop.
+import os
+import time
+import threading
+from collections import deque
+
+pins = [29, 31, 33, 37]
+forward = [(0, 1, 0, 1), (1, 0, 0, 1), (1, 0, 1, 0), (0, 1, 1, 0)]
+backward = [(1, 0, 1, 0), (1, 0, 0, 1), (0, 1, 0, 1), (0, 1, 1, 0)]
+
+
+class MockGPIO(object):
+    # Stands in for RPi.GPIO, records (time, pin, value) of every output
+    BOARD = OUT = IN = None
+
+    def __init__(self):
+        self.log = []
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, mode):
+        pass
+
+    def output(self, pin, value):
+        self.log.append((time.time(), pin, value))
+
+    def input(self, pin):
+        return 1
+
+    def phase_times(self):
+        # Start time of every phase written. Pins are written four at a time;
+        # the all-off state at the end of a move is not a phase.
+        states = [self.log[i:i+len(pins)] for i in range(0, len(self.log), len(pins))]
+        return [state[0][0] for state in states if any(value for t, pin, value in state)]
+
+
+def write_count(path, count):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("%d" % count)
+    os.rename(tmp, path)
+
+
+class Stepper(object):
+    def __init__(self, gpio, message=None, status=None, telemetry=None, path=".focussteppercount",
+                 start_rate=25., cruise_rate=40., ramp=8):
+        self.gpio = gpio
+        self.message = message if message is not None else (lambda value: None)
+        self.status = status if status is not None else (lambda key, value: None)
+        self.telemetry = telemetry
+        self.path = path
+        # The old stepperMove ran at 25 steps/s throughout. Moves still start and end
+        # at that rate and only go faster after the ramp.
+        self.start_rate = start_rate    # steps per second at the start and end of a move
+        self.cruise_rate = cruise_rate  # steps per second in between
+        self.ramp = ramp                # steps to get from one rate to the other
+        try:
+            with open(path, "r") as f:
+                self.position = int(f.read())
+        except:
+            self.position = 0
+        self.saved = self.position
+        self.saves = 0
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.busy = False
+        self.abort = False
+        self.stop_threads = False
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        with self.cond:
+            self.stop_threads = True
+            self.abort = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(2.)
+        self.save()
+
+    def move(self, steps):
+        # Queues a relative move, returns immediately
+        if steps == 0:
+            return
+        with self.cond:
+            self.queue.append(int(steps))
+            self.cond.notify_all()
+
+    def stop(self):
+        # Drops queued moves and ends the current one after the running step
+        with self.cond:
+            self.queue.clear()
+            self.abort = True
+            self.cond.notify_all()
+
+    def idle(self):
+        with self.cond:
+            return not self.busy and len(self.queue) == 0
+
+    def wait(self, timeout=None):
+        # Blocks until all queued moves are done, returns False on timeout
+        deadline = None if timeout is None else time.time()+timeout
+        with self.cond:
+            while self.busy or len(self.queue):
+                remaining = None if deadline is None else deadline-time.time()
+                if remaining is not None and remaining <= 0.:
+                    return False
+                self.cond.wait(remaining if remaining is not None else 1.)
+        return True
+
+    def _next(self):
+        # Next move, merged with the queued moves right behind it in the same direction
+        steps = self.queue.popleft()
+        while len(self.queue) and (self.queue[0] > 0) == (steps > 0):
+            steps += self.queue.popleft()
+        return steps
+
+    def run(self):
+        while True:
+            with self.cond:
+                while len(self.queue) == 0 and not self.stop_threads:
+                    self.cond.wait()
+                if self.stop_threads:
+                    return
+                steps = self._next()
+                self.busy = True
+                self.abort = False
+            try:
+                self._drive(steps)
+                self.status("Stepper (f/F)", "%d" % self.position)
+                if self.telemetry is not None:
+                    self.telemetry.record(focus=self.position)
+                if len(self.queue) == 0:
+                    self.save()
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def intervals(self, n):
+        # Seconds per phase for each of the n steps of a move
+        result = []
+        for k in range(n):
+            x = min(1., k/float(self.ramp), (n-1-k)/float(self.ramp)) if self.ramp else 1.
+            rate = self.start_rate + (self.cruise_rate-self.start_rate)*x
+            result.append(1./rate/len(forward))
+        return result
+
+    def _drive(self, steps):
+        GPIO = self.gpio
+        sequence = forward if steps > 0 else backward
+        direction = 1 if steps > 0 else -1
+        deadline = time.time()
+        for interval in self.intervals(abs(steps)):
+            for phase in sequence:
+                for pin, value in zip(pins, phase):
+                    GPIO.output(pin, value)
+                deadline += interval
+                delay = deadline - time.time()
+                if delay > 0.:
+                    time.sleep(delay)
+            self.position += direction
+            if self.abort:
+                break
+        for pin in pins:
+            GPIO.output(pin, 0)
+
+    def save(self):
+        position = self.position
+        if position == self.saved:
+            return
+        try:
+            write_count(self.path, position)
+            self.saved = position
+            self.saves += 1
+        except (IOError, OSError) as e:
+            self.message("Cannot save focus position: %s" % e)
+
+
+def legacy_move(GPIO, inc):
+    # The old blocking loop of Observatory.stepperMove, for comparison
+    sequence = forward if inc > 0 else backward
+    for si in range(abs(inc)):
+        for phase in sequence:
+            for pin, value in zip(pins, phase):
+                GPIO.output(pin, value)
+            time.sleep(0.01)
+    for pin in pins:
+        GPIO.output(pin, 0)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import numpy as np
+
+    def report(name, gpio, total, blocked, writes, jitter=True):
+        t = np.array(gpio.phase_times())
+        dt = np.diff(t)
+        line = "%-28s %5.1f steps/s  caller blocked %8.3f ms  count writes %2d" % (name, total/(t[-1]-t[0]+dt[-1]), blocked*1000., writes)
+        if jitter:
+            # Constant rate: deviation of each phase interval from the nominal 10 ms
+            dev = np.abs(dt[dt < 0.05]-0.01)*1000.     # without the pauses between key presses
+            line += "  phase jitter p50 %.3f ms p95 %.3f ms" % (np.percentile(dev, 50), np.percentile(dev, 95))
+        print(line)
+
+    moves = [4]*10 + [20, -20, 20] + [-4]*10    # f/F key presses and autofocus moves
+    total = sum(abs(m) for m in moves)
+    directory = tempfile.mkdtemp()
+
+    gpio = MockGPIO()
+    blocked = 0.
+    for m in moves:
+        t0 = time.time()
+        legacy_move(gpio, m)
+        blocked += time.time()-t0
+    report("old stepperMove", gpio, total, blocked, len(moves))
+
+    for name, cruise_rate in [("queue, 25 steps/s", 25.), ("queue, ramp 25-40 steps/s", 40.)]:
+        gpio = MockGPIO()
+        stepper = Stepper(gpio, path=os.path.join(directory, ".focussteppercount%d" % cruise_rate), start_rate=25., cruise_rate=cruise_rate)
+        stepper.start()
+        blocked = 0.
+        for m in moves:
+            t0 = time.time()
+            stepper.move(m)
+            blocked += time.time()-t0
+        stepper.wait()
+        report(name, gpio, total, blocked, stepper.saves, jitter=cruise_rate == 25.)
+        stepper.close()
@@ -17,16 +17,23 @@
 # You should have received a copy of the GNU General Public License
 # along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
 #
+## Takes SEC second bulb exposures with the camera, see camera.py
 #
-#  killall gvfsd-gphoto2
+# Usage: ./takeimages.py SEC NUM ISO [--fake FILE_OR_DIR]
+# The camera is opened once for all NUM frames. Images go to
+# images/<date>/, latest.jpg and latest.cr2, like before, and are added
+# to images/frames.sqlite with the telescope position if the control
+# daemon is running.
 
-import os
-import time
-import glob
-import client
-import socket
 import sys
-r = os.system("killall gvfsd-gphoto2 2>\&1 /dev/null")<<8
+from camera import open_camera, CaptureSession, CameraError, daemon_context
+from frames import FrameIndex
+
+fake = None
+if "--fake" in sys.argv:
+    i = sys.argv.index("--fake")
+    fake = sys.argv[i+1]
+    del sys.argv[i:i+2]
 if len(sys.argv)<2:
     print("Usage ./takeimages.py SEC NUM ISO")
     exit(-1)
@@ -38,44 +45,19 @@ if len(sys.argv)>2:
     if len(sys.argv)>3:
         iso = sys.argv[3]
 
-d = time.strftime("%Y-%m-%d")
+def progress(i, n):
+    print("\033[92mImage %d/%d captured.\033[0m"%(i,n))
 
-start = len(glob.glob("./images/%s/full*.jpg"%d))
-    
-r = os.system("gphoto2 --set-config /main/imgsettings/imageformat=8")<<8
-if r!=0:
-    print("\033[91mProblem encountered trying to set image format.\033[0m")
+print("Configuring camera...")
+try:
+    session = CaptureSession(open_camera(fake), index=FrameIndex(), context=daemon_context())
+except CameraError as e:
+    print("\033[91mProblem encountered trying to open camera: %s\033[0m"%e)
     exit(-1)
-
-for i in range(start,N+start):
-    if os.path.isfile("capt0000.jpg"):
-        print("Deleting old image file...")
-        os.system("rm -f capt0000.jpg")
-    print("Configuring camera...")
-    r = os.system("gphoto2 --set-config capture=on --set-config iso=%s"%iso)<<8
-    if r!=0:
-        print("\033[91mProblem encountered trying to set ISO.\033[0m")
-        exit(-1)
-    r = os.system("gphoto2 --set-config shutterspeed=bulb")<<8
-    if r!=0:
-        print("\033[91mProblem encountered trying to set shutterspeed.\033[0m")
-        exit(-1)
-    # Start time 
-    jd = ( time.time() / 86400.0 ) + 2440587.5;
-    r = os.system("gphoto2 --set-config eosremoterelease=Immediate --wait-event=%ss --set-config eosremoterelease=\"Release Full\" --wait-event-and-download=5s | sed -n '/UNKNOWN/!p'"%S)
-    if r!=0:
-        print("\033[91mProblem encountered trying to take image. Make sure camera is connected and not in use.\033[0m")
-        exit(-1)
-        
-    print("\033[92mImage %d/%d captured.\033[0m"%(i-start+1,N))
-    os.system("mkdir -p images/%s" % d)
-    os.system("cp capt0000.jpg images/%s/full_%05d_jd%015.6f_iso%s_shutter%ss.jpg"%(d,i,jd,iso,S.replace("/","_")))
-    os.system("cp capt0001.cr2 images/%s/full_%05d_jd%015.6f_iso%s_shutter%ss.cr2"%(d,i,jd,iso,S.replace("/","_")))
-    os.system("convert -resize 2000x1333 capt0000.jpg images/%s/medium_%05d_jd%015.6f_iso%s_shutter%ss.jpg"%(d,i,jd,iso,S.replace("/","_")))
-    os.system("convert -resize 800x533 capt0000.jpg images/%s/small_%05d_jd%015.6f_iso%s_shutter%ss.jpg"%(d,i,jd,iso,S.replace("/","_")))
-    os.system("mv capt0001.cr2 latest.cr2")
-    os.system("mv capt0000.jpg latest.jpg")
-    os.system("ln -f -s %s/small_%05d_jd%015.6f_iso%s_shutter%ss.jpg images/latest_small.jpg"%(d,i,jd,iso,S.replace("/","_")))
-    os.system("ln -f -s %s/medium_%05d_jd%015.6f_iso%s_shutter%ss.jpg images/latest_medium.jpg"%(d,i,jd,iso,S.replace("/","_")))
-    os.system("ln -f -s %s/full_%05d_jd%015.6f_iso%s_shutter%ss.jpg images/latest_full.jpg"%(d,i,jd,iso,S.replace("/","_")))
-
+try:
+    session.run(S, N, iso, progress=progress)
+except CameraError as e:
+    print("\033[91mProblem encountered trying to take image. Make sure camera is connected and not in use. (%s)\033[0m"%e)
+    exit(-1)
+finally:
+    session.close()
@@ -0,0 +1,188 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Telemetry time series, one memory-mapped ring file per night
+#
+# Each row holds every column. record() only sets the columns it is given,
+# the others keep their previous value. The file starts with a small
+# header holding the number of rows ever written, so a restart during the
+# night continues where it left off. Rows are written straight into the
+# mapped columns, nothing is allocated per append.
+#
+#   store = TelemetryStore()
+#   store.record(volt=12.1)
+#   data = store.query(last=600.)     # dict of arrays, oldest first
+import os
+import time
+import threading
+import numpy as np
+
+dtype = np.dtype([
+    ("t",      "<f8"),  # unix time
+    ("alt1",   "<f4"),  # accelerometer tilt [deg]
+    ("alt3",   "<f4"),  # accelerometer bank [deg]
+    ("volt",   "<f4"),  # battery bank [V], -1 if unknown
+    ("ra",     "<u4"),  # raw Stellarium units, see conversions.py
+    ("dec",    "<i4"),
+    ("focus",  "<i4"),  # focus stepper count
+    ("relays", "<u1"),  # bit n set if relay n is switched on
+])
+header_dtype = np.dtype([("magic", "S8"), ("count", "<u8"), ("capacity", "<u8")])
+header_size = 64
+magic = b"PTCSTLM1"
+
+
+def night_of(t):
+    # Nights are named after the local date on which they start, so the
+    # file changes at noon and not in the middle of an observing run.
+    return time.strftime("%Y-%m-%d", time.localtime(t-12*3600))
+
+
+class TelemetryStore(object):
+    def __init__(self, directory="logs/telemetry", capacity=1<<20):
+        self.directory = directory
+        self.capacity = capacity    # rows of new files, an existing file keeps its own
+        self.lock = threading.Lock()
+        self.path = None
+        self.night = None
+        self.current = dict((name, 0) for name in dtype.names)
+        self.current["volt"] = -1.
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _open(self, night):
+        if self.path is not None:
+            self.close()
+        self.path = os.path.join(self.directory, night+".tlm")
+        self.night = night
+        self.header, self.data = open_file(self.path, self.capacity, mode="r+" if os.path.exists(self.path) else "w+")
+        self.columns = [(name, self.data[name]) for name in dtype.names]
+        count = int(self.header["count"][0])
+        if count:
+            last = self.data[(count-1) % len(self.data)]
+            for name in dtype.names:
+                self.current[name] = last[name]
+
+    def close(self):
+        if self.path is not None:
+            self.data.flush()
+            self.header.flush()
+            del self.columns, self.data, self.header
+            self.path = None
+
+    def record(self, t=None, **values):
+        t = time.time() if t is None else t
+        with self.lock:
+            night = night_of(t)
+            if night != self.night:
+                self._open(night)
+            self.current.update(values)
+            self.current["t"] = t
+            count = int(self.header["count"][0])
+            i = count % len(self.data)
+            for name, column in self.columns:
+                column[i] = self.current[name]
+            self.header["count"][0] = count+1
+
+    def query(self, last=None, start=None, end=None):
+        # Rows with start <= t < end, or of the last `last` seconds
+        if last is not None:
+            start = time.time()-last
+        with self.lock:
+            if self.path is None:
+                return empty()
+            return window(self.header, self.data, start, end)
+
+    def flush(self):
+        with self.lock:
+            if self.path is not None:
+                self.data.flush()
+                self.header.flush()
+
+
+def open_file(path, capacity=None, mode="r"):
+    # Returns (header, rows) memmaps. capacity is only needed for new files.
+    if mode == "w+":
+        with open(path, "wb") as f:
+            f.truncate(header_size + capacity*dtype.itemsize)
+        header = np.memmap(path, dtype=header_dtype, mode="r+", shape=(1,))
+        header["magic"][0] = magic
+        header["capacity"][0] = capacity
+        mode = "r+"
+    else:
+        header = np.memmap(path, dtype=header_dtype, mode=mode, shape=(1,))
+        if header["magic"][0] != magic:
+            raise ValueError("%s is not a telemetry file" % path)
+    data = np.memmap(path, dtype=dtype, mode=mode, offset=header_size, shape=(int(header["capacity"][0]),))
+    return header, data
+
+def ordered(header, data):
+    # Copy of the valid rows, oldest first
+    count = int(header["count"][0])
+    if count <= len(data):
+        return np.array(data[:count])
+    i = count % len(data)
+    return np.concatenate((data[i:], data[:i]))
+
+def _search(t, value):
+    # First index with t[i] >= value. Plain binary search, so the mapped
+    # column is not copied the way np.searchsorted would copy it.
+    lo, hi = 0, len(t)
+    while lo < hi:
+        mid = (lo+hi)//2
+        if t[mid] < value:
+            lo = mid+1
+        else:
+            hi = mid
+    return lo
+
+def window(header, data, start=None, end=None):
+    # Copy of the rows with start <= t < end, oldest first. The ring is one
+    # or two contiguous segments; only the matching rows are copied.
+    count = int(header["count"][0])
+    if count <= len(data):
+        segments = [data[:count]]
+    else:
+        i = count % len(data)
+        segments = [data[i:], data[:i]]
+    parts = []
+    for segment in segments:
+        t = segment["t"]
+        i0 = 0 if start is None else _search(t, start)
+        i1 = len(t) if end is None else _search(t, end)
+        if i1 > i0:
+            parts.append(np.array(segment[i0:i1]))
+    rows = np.concatenate(parts) if len(parts) else np.zeros(0, dtype=dtype)
+    return dict((name, rows[name]) for name in dtype.names)
+
+def empty():
+    return dict((name, np.zeros(0, dtype=dtype[name])) for name in dtype.names)
+
+def select_range(rows, last=None, start=None, end=None):
+    t = rows["t"]
+    if last is not None and len(t):
+        start = t[-1] - last
+    i0 = 0 if start is None else np.searchsorted(t, start, side="left")
+    i1 = len(t) if end is None else np.searchsorted(t, end, side="left")
+    return dict((name, rows[name][i0:i1]) for name in dtype.names)
+
+def load(path, last=None, start=None, end=None):
+    # Read a night for analysis, e.g. load("logs/telemetry/2014-10-18.tlm").
+    # Here last is counted back from the final row.
+    header, data = open_file(path)
+    return select_range(ordered(header, data), last, start, end)
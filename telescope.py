@@ -0,0 +1,280 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Telescope control core: status polling, Stellarium and auto alignment.
+# It has no curses or GPIO dependencies. Front ends pass in callbacks for
+# log messages, status lines and the focus stepper.
+import serial
+import struct
+import threading
+import time
+from conversions import *
+from atcl import ATCLPort, to_text
+from netserver import NetServer
+from motion import MotionModel
+from settle import SettleDetector
+
+# Expected shape of the replies to the coordinate queries
+coordinate_replies = {'!CGra;': is_ra_str, '!CGde;': is_dec_str, '!CGtr;': is_ra_str, '!CGtd;': is_dec_str}
+
+
+class Telescope(object):
+    def __init__(self, message=None, status=None, focus=None, stellarium_port=10001, autoalignment_port=10002, stream_rate=10., telemetry=None):
+        self.message = message if message is not None else (lambda value: None)
+        self.status = status if status is not None else (lambda key, value: None)
+        self.focus = focus
+        self.telemetry = telemetry
+        self.stellarium_port = stellarium_port
+        self.autoalignment_port = autoalignment_port
+        self.stream_rate = stream_rate  # position updates per second sent to Stellarium and the display
+
+        self.port = None
+        self.port_name = None
+        self.lock = threading.Lock()
+        self.states = [
+        #    value command   poll interval [s]
+            ['',  '!AGas;',  10.],
+            ['',  '!AGai;',  10.],
+            ['',  '!CGra;',  0.5],
+            ['',  '!CGde;',  0.5],
+            ['',  '!CGtr;',  2.],
+            ['',  '!CGtd;',  2.]
+        ]
+        self.alignment_mode = "goto"
+        self.stop_threads = False
+        self.threads = []
+
+        self.server = None
+        self.motion = MotionModel()
+        self.settle = SettleDetector(on_change=self.settle_changed)
+        self.goto_time = 0.
+        self.slew_interval = 0.25   # position poll interval while slewing
+
+    def open(self, port_name, baudrate=19200):
+        try:
+            self.port = ATCLPort(serial.Serial(port_name, baudrate, timeout = 0.1), message=self.message)
+            self.port_name = port_name
+            self.status('Telescope', "Opened "+port_name)
+            return True
+        except:
+            self.status('Telescope', "Unable to open port at "+port_name)
+            return False
+
+    def start(self):
+        self.server = NetServer(self, stellarium_port=self.stellarium_port, autoalignment_port=self.autoalignment_port)
+        self.server.start()
+        for target in [self.telescope_communication, self.position_stream]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def close(self):
+        self.stop_threads = True
+        for thread in self.threads:
+            thread.join(1.)
+        if self.server is not None:
+            self.server.close()
+        if self.port is not None:
+            self.port.close()
+
+    def telescope_cmd(self, cmd, hideResponse=False, timeout=1.):
+        if self.port is not None:
+            future = self.port.command(cmd,hideResponse)
+            ret = future.result(timeout)
+            if not future.done():
+                self.port.resync()
+            return ret
+        return None
+
+    def poll(self, due):
+        # Write all queries in due in one burst, then collect the responses in order.
+        # Returns the current position in raw units if it was part of the batch, and
+        # False if the batch was rejected because a response was missing or did not
+        # have the shape expected for its command.
+        futures = self.port.commands([self.states[index][1] for index in due], hideResponse=True)
+        values = []
+        ra, dec = None, None
+        for index, future in zip(due, futures):
+            command = self.states[index][1]
+            ret = future.result(1.)
+            if not future.done():
+                break
+            if ret is not None and len(ret)>0:
+                if ret[0] == chr(0x8F):
+                    ret = "ATCL_ACK"
+                elif ret[0] == chr(0xA5):
+                    ret = "ATCL_NACK"
+                elif command in coordinate_replies and not coordinate_replies[command](ret):
+                    break
+                elif command == '!CGra;':
+                    ra = ra_str2raw(ret)
+                elif command == '!CGde;':
+                    dec = dec_str2raw(ret)
+            else:
+                ret = "N/A"
+
+            if "Internal error" in ret:
+                self.message(ret)
+                ret = "N/A"
+            values.append(ret)
+        if len(values) < len(due):
+            # A response got lost, the ones after it may belong to other commands.
+            # Let the controller finish answering the batch before starting over.
+            futures[-1].result(1.)
+            self.port.resync()
+            return False
+        for index, ret in zip(due, values):
+            self.states[index][0] = ret
+        return ra, dec
+
+    def telescope_communication(self):
+        next_poll = [0.]*len(self.states)
+        while self.stop_threads==False:
+            if self.port is not None:
+                now = time.time()
+                due = [index for index in range(len(self.states)) if next_poll[index]<=now]
+                for index in due:
+                    interval = self.states[index][2]
+                    if index in [2,3] and not self.settle.settled:
+                        interval = min(interval, self.slew_interval)
+                    next_poll[index] = now + interval
+                result = self.poll(due)
+                if result is False:
+                    for index in due:
+                        next_poll[index] = 0.   # ask again right away
+                    continue
+                ra, dec = result
+                self.status("Alignment state/side", self.states[0][0]+" / "+self.states[1][0])
+                self.status("Target coordinates", self.states[4][0]+"  "+self.states[5][0])
+                if ra is not None and dec is not None:
+                    self.motion.add_sample(ra, dec)
+                    target_ra, target_dec = None, None
+                    if 4 in due and 5 in due and now > self.goto_time:
+                        # only trust the controller's target once it has seen the last goto
+                        try:
+                            target_ra, target_dec = ra_str2raw(self.states[4][0]), dec_str2raw(self.states[5][0])
+                        except:
+                            pass
+                    self.settle.update(ra, dec, target_ra, target_dec)
+                    if self.telemetry is not None:
+                        self.telemetry.record(ra=ra, dec=dec)
+                else:
+                    self.status("Current coordinates", self.states[2][0]+"  "+self.states[3][0])
+                time.sleep(max(0.05, min(next_poll)-time.time()))
+            else:
+                time.sleep(1)
+
+    def position_stream(self):
+        # Extrapolated position between polls. No serial traffic involved.
+        last, last_sent = None, 0.
+        while self.stop_threads==False:
+            position = self.motion.estimate()
+            if position is not None and (position != last or time.time()-last_sent > 1.):
+                ra, dec = position
+                if self.server is not None:
+                    self.server.send_position(ra, dec)
+                if position != last:
+                    self.status("Current coordinates", ra_raw2str(ra)+"  "+dec_raw2str(dec))
+                last, last_sent = position, time.time()
+            time.sleep(1./self.stream_rate)
+
+    def telescope_cmds(self, cmds):
+        # Queue a sequence of commands in one write without waiting for the
+        # responses, so callers on the network loop never block.
+        if self.port is not None:
+            return self.port.commands(cmds)
+        return []
+
+    def goto(self, ra_string, dec_string):
+        # Goto or, in alignment mode, sync to the given coordinates
+        if dec_string[-2:]=="60":
+            dec_string = dec_string[:-2]+"59"
+        cmds = ['!CStr' + ra_string + ';', '!CStd' + dec_string + ';']
+        if self.alignment_mode=="align":
+            cmds.append('!AFrn;')
+            self.alignment_mode = "goto"
+            self.status("Alignment mode", "GoTo next coordinates.")
+        elif self.alignment_mode=="goto":
+            cmds.append('!GTrd;')
+            self.motion.set_target(ra_str2raw(ra_string), dec_str2raw(dec_string))
+            self.goto_time = time.time()
+            self.settle.goto(ra_str2raw(ra_string), dec_str2raw(dec_string))
+        return self.telescope_cmds(cmds)
+
+    def settle_changed(self, settled):
+        if settled:
+            self.motion.clear_target()
+            self.status("Mount", "Settled")
+            if self.goto_time:
+                self.message("Settled %.1f s after goto" % (self.settle.since-self.goto_time))
+        else:
+            self.status("Mount", "Slewing")
+
+    def align(self, direction, ra_string, dec_string):
+        if dec_string[-2:]=="60":
+            dec_string = dec_string[:-2]+"59"
+        futures = self.telescope_cmds(['!ASas' + direction + ';', '!CStr' + ra_string + ';', '!CStd' + dec_string + ';', '!AFrn;'])
+        self.alignment_mode = "goto"
+        self.status("Alignment mode", "GoTo next coordinates.")
+        return futures
+
+    def start_manual_alignment(self, direction):
+        self.status("Alignment mode", "Align to next coordinates (%s)" % direction)
+        self.alignment_mode = "align"
+        self.lock.acquire()
+        self.telescope_cmd('!ASas' + direction + ';')
+        self.lock.release()
+
+    def start_manual_alignment_e(self):
+        self.start_manual_alignment("East")
+
+    def start_manual_alignment_w(self):
+        self.start_manual_alignment("West")
+
+    def stellarium_command(self, data):
+        if len(data)==20:   # goto command
+            data = struct.unpack('<hhQIi',data)
+            ra_string, dec_string = ra_raw2str(data[-2]), dec_raw2str(data[-1])
+            self.message("Received from stellarium: %s %s" % (ra_string,dec_string))
+            self.goto(ra_string, dec_string)
+        else:
+            self.message("Unknown command received from stellarium. Length %d."%len(data))
+
+    def autoalignment_command(self, data):
+        data_split = to_text(data).split(";")
+        if data_split[0]=="East" or data_split[0]=="West":
+            direction, ra_string, dec_string = data_split
+            self.message("Auto alignment coordinates received: (%s) %s %s" %(direction, ra_string, dec_string))
+            self.align(direction, ra_string, dec_string)
+        elif data_split[0]=="Focus":
+            try:
+                steps = int(data_split[1])
+            except:
+                self.message("Unknown stepper command received.")
+                return
+            if abs(steps)>20:
+                self.message("Too many steps received.")
+            elif self.focus is not None:
+                if self.server is not None:
+                    self.server.defer(self.focus, steps)
+                else:
+                    self.focus(steps)
+            self.message("Focus increment: %d"%steps)
+        else:
+            self.message("Unknown command received.")
@@ -0,0 +1,153 @@
+# UTSC | PTCS
+# University of Toronto Scarborough | Python Telescope Control System
+#
+# Copyright (c) 2014 Eric Dapp, Caden Armstrong, Hanno Rein
+#
+# UTSC | PCTS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# UTSC | PCTS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with UTSC | PCTS.  If not, see <http://www.gnu.org/licenses/>.
+#
+## Background medium/small renditions of captured frames
+#
+# A pool of worker processes builds the resized JPEGs while the camera is
+# already exposing the next frame. Each frame is decoded only once, at a
+# reduced JPEG scale where possible (Pillow draft mode), and the images
+# are scaled down from there; without Pillow the workers run ImageMagick's
+# convert. At most `backlog` frames are queued or being worked on;
+# submit() blocks beyond that, which holds up the capture loop rather
+# than letting the queue grow over a long night. A frame that is not done
+# after `timeout` seconds (its worker died) is given up and reported as
+# an error instead of blocking forever. The latest_*.jpg links
+# are switched by renaming, so a web page never sees a missing link.
+import os
+import sys
+import time
+import threading
+import subprocess
+import multiprocessing
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+sizes = [("medium", (2000, 1333)), ("small", (800, 533))]
+
+
+def render(source, targets):
+    # Runs in a worker process. targets: [(path, (width, height))], largest first
+    if Image is None:
+        for path, size in targets:
+            if subprocess.call(["convert", "-resize", "%dx%d" % size, source, path]) != 0:
+                raise IOError("convert failed for %s" % path)
+        return
+    image = Image.open(source)
+    image.draft("RGB", targets[0][1])
+    image = image.convert("RGB")
+    for path, size in targets:
+        image.thumbnail(size, Image.LANCZOS if hasattr(Image, "LANCZOS") else Image.ANTIALIAS)
+        image.save(path, "JPEG", quality=90)
+
+
+def render_job(source, targets):
+    # Errors are returned, not raised: Python 2 pools have no error_callback
+    try:
+        render(source, targets)
+    except Exception as e:
+        return "%s: %s" % (type(e).__name__, e)
+
+
+def link(target, name):
+    # Atomic replacement of the symlink name -> target
+    tmp = name + ".tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(target, tmp)
+    os.rename(tmp, name)
+
+
+class Renditions(object):
+    def __init__(self, directory="images", workers=2, backlog=4, timeout=60.):
+        self.directory = directory
+        self.pool = multiprocessing.Pool(workers)
+        self.backlog = backlog
+        self.timeout = timeout  # a frame not done by then is given up, e.g. because its worker died
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.jobs = {}          # job number -> (frame number, submit time)
+        self.next_job = 0
+        self.abandoned = 0
+        self.linked = -1        # frame number the latest_* links point to
+        self.errors = []
+
+    def submit(self, i, full, paths):
+        # Queues frame i. full: the full size JPEG, paths: {kind: path} for the sizes above.
+        # Blocks while `backlog` frames are still being processed.
+        with self.lock:
+            while len(self.jobs) >= self.backlog:
+                self._expire()
+                if len(self.jobs) >= self.backlog:
+                    self.idle.wait(1.)
+            job = self.next_job
+            self.next_job += 1
+            self.jobs[job] = (i, time.time())
+        targets = [(paths[kind], size) for kind, size in sizes if kind in paths]
+        links = [("full", full)] + [(kind, paths[kind]) for kind, size in sizes if kind in paths]
+        kwargs = {}
+        if sys.version_info[0] >= 3:
+            kwargs["error_callback"] = lambda e: self._done(job, links, "%s: %s" % (type(e).__name__, e))
+        self.pool.apply_async(render_job, (full, targets), callback=lambda error: self._done(job, links, error), **kwargs)
+
+    def _expire(self):
+        # Gives up frames older than timeout. A worker that dies never calls back.
+        now = time.time()
+        for job, (i, t) in list(self.jobs.items()):
+            if now-t > self.timeout:
+                del self.jobs[job]
+                self.abandoned += 1
+                self.errors.append("Rendition of frame %d did not finish within %g s" % (i, self.timeout))
+                self.idle.notify_all()
+
+    def _done(self, job, links, error):
+        # Called on the pool's result thread
+        with self.lock:
+            if job not in self.jobs:
+                return          # given up already
+            i = self.jobs.pop(job)[0]
+            try:
+                if error is not None:
+                    self.errors.append("Rendition of frame %d failed: %s" % (i, error))
+                elif i > self.linked:
+                    self.linked = i
+                    for kind, path in links:
+                        link(os.path.relpath(path, self.directory), os.path.join(self.directory, "latest_%s.jpg" % kind))
+            except OSError as e:
+                self.errors.append(str(e))
+            finally:
+                self.idle.notify_all()
+
+    def flush(self, timeout=None):
+        # Waits until all submitted frames are done or given up, returns False on timeout
+        deadline = None if timeout is None else time.time()+timeout
+        with self.lock:
+            while len(self.jobs) and (deadline is None or time.time() < deadline):
+                self._expire()
+                if len(self.jobs):
+                    self.idle.wait(1. if deadline is None else max(0., min(1., deadline-time.time())))
+            return len(self.jobs) == 0
+
+    def close(self):
+        self.flush()
+        if self.abandoned:
+            self.pool.terminate()   # close() + join() would wait for the stuck workers
+        else:
+            self.pool.close()
+        self.pool.join()